@@ -1,12 +1,17 @@
 from django.contrib import admin
 
 from .models import Post,Group
+from .search import filter_queryset
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ("pk","text", "pub_date", "author")
 
     search_fields = ("text",)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Look the term up in the full-text index instead of LIKE '%...%'.
+        return filter_queryset(queryset, search_term), False
+
     list_filter = ("pub_date",)
     empty_value_display = '-пусто-'
     
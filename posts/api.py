@@ -0,0 +1,307 @@
+"""
+Read-only JSON API, mounted at /api/v1/.
+
+Rows are read with `values()` and nested into plain dicts, so no model
+instances are built. `?fields=` narrows the SELECT to the requested
+columns, embedded authors and groups come from the same joined query, and
+lists are paged by cursor like the HTML views.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import condition, require_safe
+
+from .authors import get_author_or_404
+from .counters import stats_for
+from .feed import FeedPaginator
+from .generations import (
+    GLOBAL, author_scope, get_generations, group_scope, post_scope
+)
+from .models import Comment, Group, Post, User
+from .paginator import CursorPaginator
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+
+class ApiError(Exception):
+    def __init__(self, detail, status=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+def media_url(name):
+    return settings.MEDIA_URL + name if name else None
+
+
+class Resource:
+    """
+    Public field names of one model mapped to `values()` columns. A dict
+    embeds a related object, read through the join of the same query.
+    """
+
+    def __init__(self, fields, formatters=None):
+        self.fields = fields
+        self.formatters = formatters or {}
+
+    def requested(self, request):
+        fields = request.GET.get('fields')
+        if not fields:
+            return list(self.fields)
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError('Unknown fields: %s' % ', '.join(unknown))
+        return names
+
+    def columns(self, names, required=()):
+        columns = list(required)
+        for name in names:
+            spec = self.fields[name]
+            for column in spec.values() if isinstance(spec, dict) else [spec]:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def serialize(self, row, names):
+        data = {}
+        for name in names:
+            spec = self.fields[name]
+            if isinstance(spec, dict):
+                value = {key: row[column] for key, column in spec.items()}
+                if all(item is None for item in value.values()):
+                    value = None
+            else:
+                value = row[spec]
+            if name in self.formatters:
+                value = self.formatters[name](value)
+            data[name] = value
+        return data
+
+
+AUTHOR = {
+    'username': 'author__username',
+    'first_name': 'author__first_name',
+    'last_name': 'author__last_name',
+}
+
+POSTS = Resource({
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'image': 'image',
+    'comments_count': 'comments_count',
+    'author': AUTHOR,
+    'group': {'slug': 'group__slug', 'title': 'group__title'},
+}, formatters={'image': media_url})
+
+COMMENTS = Resource({
+    'id': 'id',
+    'post': 'post_id',
+    'parent': 'parent_id',
+    'text': 'text',
+    'created': 'created',
+    'author': AUTHOR,
+})
+
+GROUPS = Resource({
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'description': 'description',
+    'posts_count': 'posts_count',
+})
+
+PROFILES = Resource({
+    'id': 'id',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'posts_count': 'stats__posts_count',
+    'followers_count': 'stats__followers_count',
+    'following_count': 'stats__following_count',
+})
+
+POST_ORDERING = ('-pub_date', '-id')
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    return max(1, min(size, API_MAX_PAGE_SIZE))
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri('?' + query.urlencode())
+
+
+def page_data(request, resource, page):
+    names = resource.requested(request)
+    return {
+        'results': [resource.serialize(row, names) for row in page],
+        'next': page_link(request, page.next_cursor),
+        'previous': page_link(request, page.previous_cursor),
+    }
+
+
+def list_data(request, resource, queryset, ordering=POST_ORDERING):
+    required = [name.lstrip('-') for name in ordering]
+    rows = queryset.values(*resource.columns(resource.requested(request), required))
+    paginator = CursorPaginator(rows, page_size(request), ordering)
+    return page_data(request, resource, paginator.get_page(request.GET.get('cursor')))
+
+
+def detail_data(request, resource, queryset, **lookup):
+    names = resource.requested(request)
+    row = get_object_or_404(queryset.values(*resource.columns(names)), **lookup)
+    return resource.serialize(row, names)
+
+
+def api_view(scopes=None):
+    """
+    Wrap a view returning plain data into a JSON GET endpoint. With
+    `scopes`, the ETag is made from their generations and a current client
+    gets a 304 before the view runs; otherwise it is a digest of the body.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                data = view(request, *args, **kwargs)
+            except ApiError as error:
+                return JsonResponse({'detail': error.detail}, status=error.status)
+            except Http404:
+                return JsonResponse({'detail': 'Not found.'}, status=404)
+            response = JsonResponse(data)
+            if scopes is None:
+                response['ETag'] = '"%s"' % hashlib.md5(response.content).hexdigest()
+                response = get_conditional_response(
+                    request, etag=response['ETag'], response=response
+                )
+            return response
+
+        if scopes is not None:
+            def etag(request, *args, **kwargs):
+                generations = get_generations(*scopes(**kwargs))
+                key = '.'.join(str(generation) for generation in generations)
+                return '"api-%s"' % hashlib.md5(key.encode()).hexdigest()
+            wrapper = condition(etag_func=etag)(wrapper)
+
+        @require_safe
+        @wraps(view)
+        def endpoint(request, *args, **kwargs):
+            response = wrapper(request, *args, **kwargs)
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return endpoint
+    return decorator
+
+
+@api_view(lambda: [GLOBAL])
+def post_list(request):
+    return list_data(request, POSTS, Post.objects.all())
+
+
+def post_scopes(post_id):
+    """
+    The scopes of a post and of the author and group it embeds. Which
+    author and group those are changes only with writes that bump the post,
+    renames included, so the lookup is cached under its generation.
+    """
+    scope = post_scope(post_id)
+    key = 'api:owners:%s:%s' % (post_id, get_generations(scope)[0])
+    owners = cache.get(key)
+    if owners is None:
+        owners = Post.objects.filter(pk=post_id).values_list(
+            'author__username', 'group__slug'
+        ).first()
+        if owners is None:
+            return [scope]
+        cache.set(key, owners, settings.PAGE_CACHE_TIMEOUT)
+    username, slug = owners
+    scopes = [scope, author_scope(username)]
+    if slug is not None:
+        scopes.append(group_scope(slug))
+    return scopes
+
+
+@api_view(post_scopes)
+def post_detail(request, post_id):
+    return detail_data(request, POSTS, Post.objects.all(), pk=post_id)
+
+
+@api_view(post_scopes)
+def comment_list(request, post_id):
+    get_object_or_404(Post.objects.values('pk'), pk=post_id)
+    return list_data(
+        request, COMMENTS, Comment.objects.filter(post_id=post_id),
+        ordering=('created', 'id'),
+    )
+
+
+@api_view()
+def group_list(request):
+    return list_data(request, GROUPS, Group.objects.all(), ordering=('title', 'id'))
+
+
+@api_view(lambda slug: [group_scope(slug)])
+def group_detail(request, slug):
+    return detail_data(request, GROUPS, Group.objects.all(), slug=slug)
+
+
+@api_view(lambda slug: [group_scope(slug)])
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.values('pk'), slug=slug)
+    return list_data(request, POSTS, Post.objects.filter(group_id=group['pk']))
+
+
+@api_view(lambda username: [author_scope(username)])
+def profile_detail(request, username):
+    names = PROFILES.requested(request)
+    row = get_object_or_404(
+        User.objects.values(*PROFILES.columns(names, required=['id'])),
+        username=username,
+    )
+    if row.get('stats__posts_count', 0) is None:
+        # No counters row yet: create it from real counts.
+        stats = stats_for(row['id'])
+        for column in ('posts_count', 'followers_count', 'following_count'):
+            row['stats__' + column] = getattr(stats, column)
+    return PROFILES.serialize(row, names)
+
+
+@api_view(lambda username: [author_scope(username)])
+def profile_posts(request, username):
+    author = get_author_or_404(username)
+    return list_data(request, POSTS, Post.objects.filter(author_id=author.pk))
+
+
+class FeedRowsPaginator(FeedPaginator):
+    def __init__(self, user, per_page, columns):
+        super().__init__(user, per_page)
+        self.columns = columns
+
+    def load(self, pks):
+        rows = Post.objects.filter(pk__in=pks).values(*self.columns)
+        return {row['id']: row for row in rows}
+
+
+@api_view()
+def follow_feed(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Authentication credentials were not provided.', status=401)
+    columns = POSTS.columns(POSTS.requested(request), required=['pub_date', 'id'])
+    paginator = FeedRowsPaginator(request.user, page_size(request), columns)
+    return page_data(request, POSTS, paginator.get_page(request.GET.get('cursor')))
@@ -0,0 +1,15 @@
+from django.urls import path
+
+from . import api
+
+urlpatterns = [
+    path("posts/", api.post_list, name="api_posts"),
+    path("posts/<int:post_id>/", api.post_detail, name="api_post"),
+    path("posts/<int:post_id>/comments/", api.comment_list, name="api_comments"),
+    path("groups/", api.group_list, name="api_groups"),
+    path("groups/<slug:slug>/", api.group_detail, name="api_group"),
+    path("groups/<slug:slug>/posts/", api.group_posts, name="api_group_posts"),
+    path("profiles/<str:username>/", api.profile_detail, name="api_profile"),
+    path("profiles/<str:username>/posts/", api.profile_posts, name="api_profile_posts"),
+    path("feed/", api.follow_feed, name="api_feed"),
+]
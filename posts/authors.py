@@ -0,0 +1,46 @@
+"""
+Read-through cache of `<username>` lookups.
+
+Every `<username>` route resolves the name with `get_author_or_404`, which
+keeps the user's id and the fields pages show in the cache. Unknown names
+are remembered too, briefly, so scans of `/<random>/` stay out of the
+database. Signals forget a name when its user is saved or deleted.
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+
+from .models import User
+
+# What pages show of an author; every other field is deferred.
+FIELDS = ('id', 'username', 'first_name', 'last_name')
+
+TIMEOUT = 24 * 60 * 60
+MISS_TIMEOUT = 5 * 60
+MISSING = 'missing'
+
+
+def _key(username):
+    return 'author:%s' % username
+
+
+def get_author_or_404(username):
+    """
+    The user named `username`, with only FIELDS loaded. It compares and
+    filters like any User; saving it only writes the loaded fields.
+    """
+    key = _key(username)
+    values = cache.get(key)
+    if values is None:
+        values = User.objects.filter(username=username).values_list(*FIELDS).first()
+        if values is None:
+            cache.set(key, MISSING, MISS_TIMEOUT)
+        else:
+            cache.set(key, values, TIMEOUT)
+    if values is None or values == MISSING:
+        raise Http404('No user named %r' % username)
+    return User.from_db(DEFAULT_DB_ALIAS, FIELDS, values)
+
+
+def forget(*usernames):
+    cache.delete_many([_key(username) for username in usernames if username])
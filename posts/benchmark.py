@@ -0,0 +1,362 @@
+"""
+Load benchmark of every route in posts/urls.py and users/urls.py.
+
+`dataset()` describes a synthetic site in the export_yatube format:
+authorship and follows follow a power law, so a few authors own most posts
+and most followers like on a real site, and comments form reply threads.
+`Benchmark` loads it with the importer and drives each route through the
+test client, timing every request and counting its queries.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import timedelta
+from importlib import import_module
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client
+from django.utils import timezone
+
+from yatube.instrumentation import RequestMetrics
+
+from .models import COMMENT_MAX_DEPTH, Group, Post, User
+from .transfer import Importer
+
+URLCONFS = ['posts.urls', 'users.urls']
+
+WORDS = (
+    'kotik sobaka more gory les reka gorod doroga poezd samolet kniga muzyka '
+    'kino teatr futbol hokkei shahmaty pogoda dozhd sneg solnce veter utro '
+    'vecher noch kofe chai hleb syr yabloko'
+).split()
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def dataset(users, groups, posts, follows, comments, seed=0):
+    """Records of a synthetic site; `follows` and `comments` are per user and per post."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - timedelta(days=365)
+    user_ids = list(range(1, users + 1))
+    popularity = zipf_weights(users)
+
+    for pk in user_ids:
+        yield {'model': 'auth.user', 'pk': pk, 'fields': {
+            'username': 'user%d' % pk, 'first_name': 'User', 'last_name': str(pk),
+            'email': '', 'password': '!', 'is_staff': False, 'is_active': True,
+            'is_superuser': False, 'last_login': None,
+            'date_joined': start.isoformat(),
+        }}
+    for pk in range(1, groups + 1):
+        yield {'model': 'posts.group', 'pk': pk, 'fields': {
+            'title': 'Group %d' % pk, 'slug': 'group-%d' % pk,
+            'description': sentence(rng),
+        }}
+    authors = rng.choices(user_ids, popularity, k=posts)
+    step = (now - start) / max(posts, 1)
+    for pk, author in enumerate(authors, 1):
+        group = rng.randint(1, groups) if groups and rng.random() < 0.5 else None
+        yield {'model': 'posts.post', 'pk': pk, 'fields': {
+            'text': sentence(rng, rng.randint(5, 60)),
+            'pub_date': (start + step * pk).isoformat(),
+            'author': author, 'group': group, 'image': '',
+        }}
+    depths = {}
+    threads = {}
+    for pk in range(1, posts * comments + 1):
+        post = rng.randint(1, posts)
+        parent = None
+        if threads.get(post) and rng.random() < 0.4:
+            parent = rng.choice(threads[post])
+            if depths[parent] + 1 >= COMMENT_MAX_DEPTH:
+                parent = None
+        depths[pk] = depths[parent] + 1 if parent else 0
+        threads.setdefault(post, []).append(pk)
+        yield {'model': 'posts.comment', 'pk': pk, 'fields': {
+            'post': post, 'author': rng.choice(user_ids), 'parent': parent,
+            'text': sentence(rng, 8), 'created': (start + step * post).isoformat(),
+        }}
+    pk = 0
+    for user in user_ids:
+        for author in set(rng.choices(user_ids, popularity, k=follows)) - {user}:
+            pk += 1
+            yield {'model': 'posts.follow', 'pk': pk, 'fields': {
+                'user': user, 'author': author,
+            }}
+
+
+def load(records):
+    importer = Importer(keep_dates=True)
+    for _ in importer.load(json.dumps(record) for record in records):
+        pass
+    importer.finish()
+
+
+def missing_scenarios():
+    """Named routes of URLCONFS the benchmark does not drive."""
+    return [
+        pattern.name
+        for urlconf in URLCONFS
+        for pattern in import_module(urlconf).urlpatterns
+        if pattern.name not in SCENARIOS
+    ]
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(share / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(timings, queries, statuses):
+    total = sum(timings)
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+        'mean_ms': round(total / len(timings) * 1000, 2),
+        'throughput_rps': round(len(timings) / total, 1) if total else None,
+        'queries_mean': round(sum(queries) / len(queries), 1),
+        'queries_max': max(queries),
+        'statuses': dict(Counter(str(status) for status in statuses)),
+    }
+
+
+class Sample:
+    """Real keys of the loaded dataset for the scenarios to pick from."""
+
+    def __init__(self, rng, size=1000):
+        self.usernames = list(User.objects.values_list('username', flat=True)[:size])
+        self.slugs = list(Group.objects.values_list('slug', flat=True)) or ['none']
+        last = Post.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        picked = rng.sample(range(1, last + 1), min(size, last))
+        self.posts = list(
+            Post.objects.filter(pk__in=picked).values_list('author__username', 'pk')
+        )
+        self.reader = User.objects.order_by('-stats__following_count').first()
+        self.author = User.objects.order_by('-stats__posts_count').first()
+        self.author_posts = list(
+            Post.objects.filter(author=self.author).values_list('pk', flat=True)[:size]
+        )
+
+
+@scenario('index')
+def index(sample, rng):
+    return 'anonymous', 'get', '/', None
+
+
+@scenario('index_feed')
+def index_feed(sample, rng):
+    return 'anonymous', 'get', '/feed/%s/' % rng.choice(['atom', 'rss', 'json']), None
+
+
+@scenario('group')
+def group(sample, rng):
+    return 'anonymous', 'get', '/group/%s/' % rng.choice(sample.slugs), None
+
+
+@scenario('group_feed')
+def group_feed(sample, rng):
+    return 'anonymous', 'get', '/group/%s/feed/atom/' % rng.choice(sample.slugs), None
+
+
+@scenario('follow_index')
+def follow_index(sample, rng):
+    return 'reader', 'get', '/follow/', None
+
+
+@scenario('trending')
+def trending(sample, rng):
+    return 'anonymous', 'get', '/trending/', None
+
+
+@scenario('new_post')
+def new_post(sample, rng):
+    return 'reader', 'post', '/new/', {'text': sentence(rng)}
+
+
+@scenario('search')
+def search(sample, rng):
+    return 'anonymous', 'get', '/search/', {'q': rng.choice(WORDS)}
+
+
+@scenario('profile')
+def profile(sample, rng):
+    return 'anonymous', 'get', '/%s/' % rng.choice(sample.usernames), None
+
+
+@scenario('post')
+def post(sample, rng):
+    return 'anonymous', 'get', '/%s/%d/' % rng.choice(sample.posts), None
+
+
+@scenario('post_comments')
+def post_comments(sample, rng):
+    return 'anonymous', 'get', '/%s/%d/comments/' % rng.choice(sample.posts), None
+
+
+@scenario('profile_feed')
+def profile_feed(sample, rng):
+    return 'anonymous', 'get', '/%s/feed/atom/' % rng.choice(sample.usernames), None
+
+
+@scenario('post_edit')
+def post_edit(sample, rng):
+    path = '/%s/%d/edit/' % (sample.author.username, rng.choice(sample.author_posts))
+    return 'author', 'get', path, None
+
+
+@scenario('add_comment')
+def add_comment(sample, rng):
+    return 'reader', 'post', '/%s/%d/comment' % rng.choice(sample.posts), {
+        'text': sentence(rng, 8),
+    }
+
+
+@scenario('profile_follow')
+def profile_follow(sample, rng):
+    return 'reader', 'get', '/%s/follow/' % rng.choice(sample.usernames), None
+
+
+@scenario('profile_unfollow')
+def profile_unfollow(sample, rng):
+    return 'reader', 'get', '/%s/unfollow/' % rng.choice(sample.usernames), None
+
+
+@scenario('profile_followers')
+def profile_followers(sample, rng):
+    return 'anonymous', 'get', '/%s/followers/' % sample.author.username, None
+
+
+@scenario('profile_following')
+def profile_following(sample, rng):
+    return 'anonymous', 'get', '/%s/following/' % sample.reader.username, None
+
+
+@scenario('signup')
+def signup(sample, rng):
+    return 'anonymous', 'get', '/auth/signup/', None
+
+
+class Benchmark:
+    def __init__(self, seed=0, clear_cache=False, sample=None):
+        self.rng = random.Random(seed)
+        self.clear_cache = clear_cache
+        self.sample = sample or Sample(self.rng)
+        self.clients = {
+            'anonymous': Client(),
+            'reader': Client(),
+            'author': Client(),
+        }
+        self.clients['reader'].force_login(self.sample.reader)
+        self.clients['author'].force_login(self.sample.author)
+
+    def request(self, name):
+        """Run one request of `name`; returns (seconds, queries, status)."""
+        client, method, path, data = SCENARIOS[name](self.sample, self.rng)
+        if self.clear_cache:
+            cache.clear()
+        metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            started = time.perf_counter()
+            response = getattr(self.clients[client], method)(path, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return elapsed, metrics.queries, response.status_code
+
+    def run(self, name, requests, warmup=0):
+        for _ in range(warmup):
+            self.request(name)
+        timings, queries, statuses = [], [], []
+        for _ in range(requests):
+            elapsed, count, status = self.request(name)
+            timings.append(elapsed)
+            queries.append(count)
+            statuses.append(status)
+        return summarize(timings, queries, statuses)
+
+    def run_concurrent(self, names, threads, requests):
+        """
+        `threads` clients at once, each sending `requests` requests picked
+        at random from `names`. Requests that raise, such as on a locked
+        database, are counted under the 'error' status; a client that cannot
+        even log in stops the run with a RuntimeError.
+        """
+        results = []
+        failures = []
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(number, seed):
+            try:
+                try:
+                    bench = Benchmark(seed, self.clear_cache, sample=self.sample)
+                except Exception as error:
+                    failures.append((number, error))
+                    barrier.abort()
+                    return
+                rows = []
+                try:
+                    barrier.wait()
+                except threading.BrokenBarrierError:
+                    return
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    try:
+                        rows.append(bench.request(bench.rng.choice(names)))
+                    except Exception:
+                        rows.append((time.perf_counter() - started, 0, 'error'))
+                results.extend(rows)
+            finally:
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=worker, args=(number, self.rng.random()))
+            for number in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            for thread in workers:
+                thread.join()
+            number, error = failures[0]
+            raise RuntimeError(
+                'Client %d of %d failed to start: %s' % (number + 1, threads, error)
+            ) from error
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        summary = summarize(*zip(*results))
+        summary['threads'] = threads
+        # Requests finished per second of wall time, across all threads.
+        summary['throughput_rps'] = round(len(results) / wall, 1)
+        return summary
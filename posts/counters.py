@@ -0,0 +1,95 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+AUTHOR_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+# (model, counter field, counted model, foreign key of the counted model)
+COUNTERS = [
+    (Post, 'comments_count', Comment, 'post'),
+    (Group, 'posts_count', Post, 'group'),
+] + [
+    (AuthorStats, field, source, fk)
+    for field, (source, fk) in AUTHOR_COUNTERS.items()
+]
+
+
+def count_of(model, fk):
+    """Correlated COUNT(*) of `model` rows whose `fk` points at the outer row."""
+    rows = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def moved(field, delta):
+    # Counters are unsigned: one that drifted to 0 stays there instead of
+    # failing the write that decrements it. repair() fixes the drift.
+    return Greatest(F(field) + delta, Value(0))
+
+
+def add(model, pk, field, delta):
+    if pk is not None:
+        model.objects.filter(pk=pk).update(**{field: moved(field, delta)})
+
+
+def add_to_author(user_id, field, delta):
+    updated = AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: moved(field, delta)}
+    )
+    # Never create rows while decrementing: the user may be mid-deletion.
+    if not updated and delta > 0:
+        stats_for(user_id)
+
+
+def stats_for(user_id):
+    """
+    Return the user's AuthorStats, creating the row from real counts the
+    first time it is needed.
+    """
+    stats = AuthorStats.objects.filter(user_id=user_id).first()
+    if stats is not None:
+        return stats
+    counts = (
+        User.objects.filter(pk=user_id)
+        .annotate(**{
+            field: count_of(source, fk)
+            for field, (source, fk) in AUTHOR_COUNTERS.items()
+        })
+        .values(*AUTHOR_COUNTERS)
+        .first()
+    )
+    if counts is None:
+        return AuthorStats(user_id=user_id)
+    stats, _ = AuthorStats.objects.get_or_create(user_id=user_id, defaults=counts)
+    return stats
+
+
+def repair(dry_run=False):
+    """
+    Compare every stored counter with its real COUNT(*) and fix the rows
+    that drifted. Yields `(model, field, pk, stored, actual)` per fix.
+    """
+    missing = User.objects.filter(stats__isnull=True).values_list('pk', flat=True)
+    if not dry_run:
+        for user_id in list(missing):
+            stats_for(user_id)
+    for model, field, source, fk in COUNTERS:
+        drifted = (
+            model.objects.annotate(actual=count_of(source, fk))
+            .exclude(**{field: F('actual')})
+            .values_list('pk', field, 'actual')
+        )
+        for pk, stored, actual in list(drifted):
+            if not dry_run:
+                model.objects.filter(pk=pk).update(**{field: actual})
+            yield model, field, pk, stored, actual
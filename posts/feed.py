@@ -0,0 +1,144 @@
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AuthorStats, FeedItem, Follow, Post
+from .paginator import CursorPaginator
+
+FANOUT_BATCH_SIZE = 1000
+CELEBRITIES_CACHE_KEY = 'feed:celebrities'
+
+
+def fanout_max_followers():
+    return getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+
+
+def celebrity_ids():
+    """
+    Authors with more followers than FEED_FANOUT_MAX_FOLLOWERS. Their posts
+    are not copied into every follower's feed but pulled and merged on read.
+    """
+    def compute():
+        return set(
+            AuthorStats.objects.filter(
+                followers_count__gt=fanout_max_followers()
+            ).values_list('user_id', flat=True)
+        )
+    return cache.get_or_set(CELEBRITIES_CACHE_KEY, compute, 300)
+
+
+def is_celebrity(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id, followers_count__gt=fanout_max_followers()
+    ).exists()
+
+
+def fan_out(post):
+    """Copy a freshly published post into the feed of every follower."""
+    if is_celebrity(post.author_id):
+        if post.author_id not in celebrity_ids():
+            cache.delete(CELEBRITIES_CACHE_KEY)
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    items = (
+        FeedItem(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+    _bulk_insert(items)
+
+
+def backfill(user_id, author_id):
+    """Seed a new subscription with the author's most recent posts."""
+    if author_id in celebrity_ids():
+        return
+    limit = getattr(settings, 'FEED_BACKFILL_LIMIT', 1000)
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('pk', 'pub_date')[:limit]
+    )
+    _bulk_insert(
+        FeedItem(
+            user_id=user_id, post_id=pk, author_id=author_id, pub_date=pub_date
+        )
+        for pk, pub_date in posts
+    )
+
+
+def purge(user_id, author_id):
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def _bulk_insert(items):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class FeedPaginator(CursorPaginator):
+    """
+    Pages through a user's subscription feed: the materialized FeedItem rows
+    merged with posts pulled from followed authors that skip fan-out.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(user, per_page)
+        self.user = user
+
+    def pulled_author_ids(self):
+        celebrities = celebrity_ids()
+        if not celebrities:
+            return []
+        return list(
+            Follow.objects.filter(
+                user=self.user, author_id__in=celebrities
+            ).values_list('author_id', flat=True)
+        )
+
+    def fetch(self, position, backwards, limit):
+        sources = [self._window(
+            FeedItem.objects.filter(user=self.user),
+            ('-pub_date', '-post_id'), position, backwards, limit,
+        )]
+        pulled = self.pulled_author_ids()
+        if pulled:
+            sources.append(self._window(
+                Post.objects.filter(author_id__in=pulled),
+                self.ordering, position, backwards, limit,
+            ))
+
+        keys = []
+        seen = set()
+        for key in heapq.merge(*sources, reverse=not backwards):
+            if key[1] not in seen:
+                seen.add(key[1])
+                keys.append(key)
+            if len(keys) == limit:
+                break
+
+        posts = self.load([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def load(self, pks):
+        """The page's posts by primary key; overridden to load other rows."""
+        return Post.objects.for_listing().in_bulk(pks)
+
+    def _window(self, queryset, ordering, position, backwards, limit):
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, backwards, ordering))
+        fields = [name.lstrip('-') for name in ordering]
+        queryset = queryset.order_by(*self.order_by(backwards, ordering))
+        return list(queryset.values_list(*fields)[:limit])
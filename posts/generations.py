@@ -0,0 +1,137 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
+
+GLOBAL = ('global', '')
+TRENDING = ('trending', '')
+
+
+def _key(scope):
+    return 'gen:%s:%s' % scope
+
+
+def _seed():
+    # Start from the clock, not from 1, so a generation that was evicted
+    # from the cache never comes back with a value that was already used.
+    return int(time.time() * 1000)
+
+
+def get_generations(*scopes):
+    keys = [_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _seed(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    for scope in set(scopes):
+        key = _key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), None)
+
+
+def group_scope(slug):
+    return ('group', slug)
+
+
+def author_scope(username):
+    return ('author', username)
+
+
+def post_scope(post_id):
+    return ('post', post_id)
+
+
+def visitor_key(request):
+    """
+    What a page depends on besides its data: the session, which says who
+    looks at it, and the CSRF secret its forms are signed with. Visitors
+    without either cookie share one copy.
+    """
+    cookies = [
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.md5('|'.join(cookies).encode()).hexdigest()
+
+
+def page_etag(request, generations):
+    key = '%s|%s' % (
+        '.'.join(str(generation) for generation in generations),
+        visitor_key(request),
+    )
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def private_if_new_csrf_token(view):
+    # A page that signs a form for a visitor without a CSRF cookie uses a
+    # secret CsrfViewMiddleware hands out only after cache_page has stored
+    # the response, so that copy is for this visitor only: cache_page does
+    # not store private responses.
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if (request.META.get('CSRF_COOKIE_USED')
+                and settings.CSRF_COOKIE_NAME not in request.COOKIES):
+            patch_cache_control(response, private=True)
+        return response
+    return wrapper
+
+
+def cache_page_by_generation(scopes, timeout=None):
+    """
+    Like `cache_page`, but the cache key carries the current generation of
+    every scope returned by `scopes(**view_kwargs)`. Writes bump those
+    generations, so the page can be cached for long and still never stale.
+
+    Each visitor (see `visitor_key`) gets a copy of their own. The same
+    generations and visitor key make the page's ETag: a client that already
+    has the current version gets a 304 before the view or the page cache
+    runs.
+    """
+    def decorator(view):
+        def generations_of(request, kwargs):
+            if not hasattr(request, '_generations'):
+                request._generations = get_generations(*scopes(**kwargs))
+            return request._generations
+
+        def etag(request, *args, **kwargs):
+            return page_etag(request, generations_of(request, kwargs))
+
+        @condition(etag_func=etag)
+        def cached(request, *args, **kwargs):
+            generations = generations_of(request, kwargs)
+            prefix = 'g%s.%s' % (
+                '.'.join(str(generation) for generation in generations),
+                visitor_key(request),
+            )
+            page_timeout = (
+                settings.PAGE_CACHE_TIMEOUT if timeout is None else timeout
+            )
+            cached_view = cache_page(page_timeout, key_prefix=prefix)(
+                private_if_new_csrf_token(view)
+            )
+            return cached_view(request, *args, **kwargs)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = cached(request, *args, **kwargs)
+            # Revalidate on every visit instead of trusting the long max-age
+            # cache_page puts on the response; the ETag makes that cheap.
+            del response['Expires']
+            patch_cache_control(response, no_cache=True, max_age=0)
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment
+)
+from django.utils import timezone
+
+from posts import benchmark
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a synthetic dataset into a throwaway database and time every '
+        'route of posts/urls.py and users/urls.py through the test client.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument(
+            '--follows', type=int, default=20, help='Follows drawn per user.',
+        )
+        parser.add_argument(
+            '--comments', type=int, default=2, help='Comments per post on average.',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=50, help='Timed requests per route.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5, help='Untimed requests per route.',
+        )
+        parser.add_argument(
+            '--routes', default='', help='Comma separated route names (default: all).',
+        )
+        parser.add_argument(
+            '--clear-cache', action='store_true',
+            help='Clear the cache before every request to time cache misses.',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Also run the routes mixed, from this many threads at once.',
+        )
+        parser.add_argument(
+            '--no-pragmas', action='store_true',
+            help=(
+                'Open the database without the PRAGMAS and TRANSACTION_MODE '
+                'of DATABASES, as a baseline.'
+            ),
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON here.')
+
+    def handle(self, *args, **options):
+        missing = benchmark.missing_scenarios()
+        if missing:
+            self.stderr.write('Routes without a scenario: %s' % ', '.join(missing))
+        routes = [name for name in options['routes'].split(',') if name]
+        unknown = set(routes) - set(benchmark.SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown routes: %s' % ', '.join(sorted(unknown)))
+        routes = routes or list(benchmark.SCENARIOS)
+
+        workdir = tempfile.mkdtemp(prefix='yatube-benchmark-')
+        if connection.vendor == 'sqlite':
+            # A file, not the in-memory default, so timings include real I/O.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'db.sqlite3')
+        if options['no_pragmas']:
+            connection.settings_dict['PRAGMAS'] = {}
+            connection.settings_dict['TRANSACTION_MODE'] = None
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        isolated = override_settings(
+            CACHES={'default': {
+                'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+                'LOCATION': os.path.join(workdir, 'cache.sqlite3'),
+            }},
+            MEDIA_ROOT=os.path.join(workdir, 'media'),
+            # The benchmark is one client hammering every route on purpose.
+            RATE_LIMITS={},
+        )
+        isolated.enable()
+        try:
+            results = self.run(options, routes)
+        finally:
+            isolated.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write('Results written to %s' % options['output'])
+
+    def run(self, options, routes):
+        sizes = {
+            name: options[name]
+            for name in ('users', 'groups', 'posts', 'follows', 'comments')
+        }
+        started = time.monotonic()
+        benchmark.load(benchmark.dataset(seed=options['seed'], **sizes))
+        self.stdout.write('Dataset loaded in %.1fs' % (time.monotonic() - started))
+
+        bench = benchmark.Benchmark(
+            seed=options['seed'], clear_cache=options['clear_cache']
+        )
+        self.stdout.write('%-18s %8s %8s %8s %9s %8s  %s' % (
+            'route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'statuses'
+        ))
+        report = {}
+        for name in routes:
+            result = report[name] = bench.run(
+                name, options['requests'], options['warmup']
+            )
+            self.stdout.write('%-18s %8.2f %8.2f %8.2f %9.1f %8.1f  %s' % (
+                name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['throughput_rps'] or 0, result['queries_mean'],
+                ' '.join('%s:%s' % item for item in sorted(result['statuses'].items())),
+            ))
+        concurrent = None
+        if options['threads'] > 1:
+            try:
+                concurrent = bench.run_concurrent(
+                    routes, options['threads'], options['requests']
+                )
+            except RuntimeError as error:
+                raise CommandError(error)
+            self.stdout.write('%-18s %8.2f %8.2f %8.2f %9.1f %8.1f  %s' % (
+                'mixed x%d' % options['threads'],
+                concurrent['p50_ms'], concurrent['p95_ms'], concurrent['p99_ms'],
+                concurrent['throughput_rps'], concurrent['queries_mean'],
+                ' '.join('%s:%s' % item for item in sorted(concurrent['statuses'].items())),
+            ))
+        return {
+            'commit': git_commit(),
+            'created': timezone.now().isoformat(),
+            'dataset': sizes,
+            'clear_cache': options['clear_cache'],
+            'pragmas': connection.settings_dict.get('PRAGMAS', {}),
+            'transaction_mode': connection.settings_dict.get('TRANSACTION_MODE'),
+            'requests': options['requests'],
+            'routes': report,
+            'concurrent': concurrent,
+        }
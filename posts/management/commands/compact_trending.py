@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Drop expired engagement buckets and rewrite the trending rankings.'
+
+    def handle(self, *args, **options):
+        ranked = trending.compact()
+        self.stdout.write(self.style.SUCCESS(f'{ranked} post(s) ranked'))
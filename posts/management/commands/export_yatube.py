@@ -0,0 +1,56 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+def open_output(path):
+    if path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+class Command(BaseCommand):
+    help = (
+        'Write users, groups, posts, comments and follows as JSON lines, '
+        'one record per line, for import_yatube.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Output file, gzipped if it ends in .gz (default: stdout).',
+        )
+
+    def handle(self, *args, **options):
+        out = open_output(options['path'])
+        # Progress goes to stderr when the records themselves go to stdout.
+        report = self.stderr if out is sys.stdout else self.stdout
+        total = 0
+        started = time.monotonic()
+        try:
+            for model, _, _ in transfer.SPECS:
+                rows = 0
+                model_started = time.monotonic()
+                for line in transfer.export_lines(model):
+                    out.write(line)
+                    out.write('\n')
+                    rows += 1
+                elapsed = max(time.monotonic() - model_started, 1e-6)
+                report.write(
+                    f'{transfer.label(model)}: {rows} rows '
+                    f'({rows / elapsed:.0f} rows/s)'
+                )
+                total += rows
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        elapsed = max(time.monotonic() - started, 1e-6)
+        report.write(self.style.SUCCESS(
+            f'Exported {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)'
+        ))
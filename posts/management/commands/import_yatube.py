@@ -0,0 +1,77 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import transfer
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a JSON lines dump written by export_yatube. Rows get new '
+        'primary keys; users and groups that already exist are reused.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Input file, gzipped if it ends in .gz (default: stdin).',
+        )
+        parser.add_argument(
+            '--keep-dates', action='store_true',
+            help='Keep the exported post and comment dates instead of '
+                 'stamping them with the import time.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.IMPORT_BATCH_SIZE,
+            help='Rows per bulk insert.',
+        )
+
+    def handle(self, *args, **options):
+        importer = transfer.Importer(
+            keep_dates=options['keep_dates'], batch_size=options['batch_size'],
+        )
+        source = open_input(options['path'])
+        totals = {}
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                for model, imported, skipped in importer.load(source):
+                    done = totals.setdefault(model, [0, 0])
+                    done[0] += imported
+                    done[1] += skipped
+                self.report(totals, started)
+                repaired = importer.finish()
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        self.stdout.write(
+            f'{repaired} counter(s) repaired, search index and feeds rebuilt'
+        )
+        self.stdout.write(
+            'Run rebuild_thumbnails to render thumbnails of imported images.'
+        )
+
+    def report(self, totals, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        total = 0
+        for model, (imported, skipped) in totals.items():
+            total += imported
+            self.stdout.write(
+                f'{transfer.label(model)}: {imported} imported, {skipped} skipped'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh the SQLite query planner statistics. Meant for cron, e.g. '
+        'hourly; PRAGMA optimize only analyzes tables that need it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Run a full ANALYZE of every table instead of PRAGMA optimize.',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'{options["database"]} is not an SQLite database')
+        statement = 'ANALYZE' if options['analyze'] else 'PRAGMA optimize'
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(f'{statement} done'))
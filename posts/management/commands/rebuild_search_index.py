@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Re-index every post in the full-text search table.'
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            self.stdout.write('Full-text index is only available on SQLite.')
+            return
+        with transaction.atomic():
+            search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import thumbnails
+from posts.models import Post
+from posts.signals import invalidate_post
+
+
+def render(name):
+    """Render the missing sizes of one image; a broken image is logged."""
+    try:
+        return thumbnails.render(name)
+    except Exception:
+        thumbnails.logger.exception('Could not make thumbnails for %s', name)
+        return 0
+
+
+def render_in_worker(name):
+    """Worker process entry point."""
+    close_old_connections()
+    return render(name)
+
+
+class Command(BaseCommand):
+    help = (
+        'Render every configured thumbnail size of every post image in a '
+        'process pool, skipping thumbnails that are already in the store.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of worker processes (default: one per CPU, 0 renders '
+                 'in this process).',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Posts read and dispatched per batch.',
+        )
+        parser.add_argument(
+            '--start-after', type=int, default=None,
+            help='Skip posts with a primary key up to and including this one.',
+        )
+        parser.add_argument(
+            '--state-file', default=None,
+            help='Remember the last finished post here and resume from it.',
+        )
+
+    def handle(self, *args, **options):
+        state_file = options['state_file']
+        start_after = options['start_after']
+        if start_after is None and state_file and os.path.exists(state_file):
+            with open(state_file) as state:
+                start_after = int(state.read().strip() or 0)
+            self.stdout.write(f'Resuming after post {start_after}')
+
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if start_after is not None:
+            posts = posts.filter(pk__gt=start_after)
+        rows = posts.order_by('pk').values_list(
+            'pk', 'image', 'author_id', 'group_id'
+        )
+
+        seen = skipped = rendered = 0
+        started = time.monotonic()
+        with self.pool(options['workers']) as pool:
+            for chunk in self.chunks(rows, options['chunk_size']):
+                seen += len(chunk)
+                todo = [row for row in chunk if thumbnails.missing_sizes(row[1])]
+                skipped += len(chunk) - len(todo)
+                names = [row[1] for row in todo]
+                for (post_id, _, author_id, group_id), made in zip(
+                    todo, self.render_all(pool, names)
+                ):
+                    if made:
+                        rendered += made
+                        # Cached pages still show the placeholder.
+                        invalidate_post(post_id, author_id, [group_id])
+                if state_file:
+                    with open(state_file, 'w') as state:
+                        state.write(str(chunk[-1][0]))
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{seen} images, {skipped} already cached, '
+                    f'{rendered} thumbnails rendered '
+                    f'({seen / elapsed:.1f} images/s, {rendered / elapsed:.1f} thumbnails/s)'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {seen} images, {rendered} thumbnails rendered'
+        ))
+
+    def pool(self, workers):
+        if not workers:
+            return nullcontext()
+        # Spawned, not forked: workers must not inherit the open cursor and
+        # database connections of this process.
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=thumbnails.setup_worker,
+            initargs=(thumbnails.worker_settings(),),
+        )
+
+    def render_all(self, pool, names):
+        if pool is None:
+            return map(render, names)
+        return pool.map(render_in_worker, names, chunksize=8)
+
+    def chunks(self, rows, size):
+        # Keyset batches rather than one streaming cursor: an open read on
+        # SQLite would keep the workers from writing to the thumbnail store.
+        last = None
+        while True:
+            batch = rows if last is None else rows.filter(pk__gt=last)
+            chunk = list(batch[:size])
+            if not chunk:
+                return
+            yield chunk
+            last = chunk[-1][0]
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Re-count stored post, comment and follow counters and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report drifted counters, do not write the fixes.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        fixed = 0
+        with transaction.atomic():
+            for model, field, pk, stored, actual in counters.repair(dry_run):
+                fixed += 1
+                self.stdout.write(
+                    f'{model.__name__}({pk}).{field}: {stored} -> {actual}'
+                )
+        verb = 'drifted' if dry_run else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'{fixed} counter(s) {verb}'))
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:31
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    length = Post._meta.get_field('excerpt').max_length
+    last = 0
+    while True:
+        batch = list(Post.objects.filter(pk__gt=last).order_by('pk').only('text')[:1000])
+        if not batch:
+            break
+        for post in batch:
+            post.excerpt = Truncator(post.text).chars(length)
+        Post.objects.bulk_update(batch, ['excerpt'])
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
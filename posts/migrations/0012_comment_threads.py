@@ -0,0 +1,42 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_paths(apps, schema_editor):
+    # Every existing comment is a top-level one: its path is its padded id.
+    Comment = apps.get_model('posts', 'Comment')
+    last = 0
+    while True:
+        batch = list(Comment.objects.filter(pk__gt=last).order_by('pk').only('pk')[:1000])
+        if not batch:
+            break
+        for comment in batch:
+            comment.path = str(comment.pk).zfill(10)
+        Comment.objects.bulk_update(batch, ['path'])
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=88),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_thread_idx'),
+        ),
+    ]
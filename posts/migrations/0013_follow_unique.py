@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk):
+    rows = (
+        model.objects.filter(**{fk: OuterRef('user_id')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def remove_duplicates(apps, schema_editor):
+    # Keep the first row of every (user, author) pair. The counters counted
+    # each duplicate, so they are recounted for the users involved.
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    duplicates = list(
+        Follow.objects.values('user_id', 'author_id')
+        .order_by()
+        .annotate(first=Min('id'), rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    users = set()
+    for pair in duplicates:
+        Follow.objects.filter(
+            user_id=pair['user_id'], author_id=pair['author_id'], id__gt=pair['first']
+        ).delete()
+        users.update([pair['user_id'], pair['author_id']])
+    AuthorStats.objects.filter(user_id__in=users).update(
+        followers_count=count_of(Follow, 'author'),
+        following_count=count_of(Follow, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='follow_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+    ]
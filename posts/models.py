@@ -1,43 +1,246 @@
 from django.db import models
+from django.utils.text import Truncator
 
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(text):
+    return Truncator(text).chars(EXCERPT_LENGTH)
+
 
 class Group(models.Model):
 
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Posts for a page of post cards: author and group come from the same
+        query, and the stored excerpt is read instead of the full text.
+        """
+        return self.select_related('author', 'group').defer('text')
+
+    def for_detail(self):
+        """One post with its author, the author's counters and the group."""
+        return self.select_related('author', 'author__stats', 'group')
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # save() is not called for these, so the excerpts are filled here.
+        objs = list(objs)
+        for post in objs:
+            post.excerpt = make_excerpt(post.text)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Post(models.Model):
     text = models.TextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True, db_index=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     group = models.ForeignKey(
     Group, on_delete=models.CASCADE, related_name='group_posts', blank=True, null=True
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # Back the (pub_date, id) keyset of CursorPaginator for every listing.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'], name='post_author_feed_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'], name='post_group_feed_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.text)
+        super().save(*args, **kwargs)
+
+
+# Replies deeper than this are attached to the deepest allowed ancestor.
+COMMENT_MAX_DEPTH = 8
+# Every level of a path is the comment id, zero-padded so that sorting the
+# paths as strings lists every thread depth-first, oldest reply first.
+PATH_STEP = 10
+
+
+def comment_path(parent_path, pk):
+    step = str(pk).zfill(PATH_STEP)
+    return f'{parent_path}/{step}' if parent_path else step
+
+
+class CommentManager(models.Manager):
+    def thread(self, comment):
+        """`comment` and all of its replies, as one range scan of the path index."""
+        # '/' sorts just before '0', so the subtree lies in [path, path + '0').
+        return self.filter(
+            post_id=comment.post_id, path__gte=comment.path, path__lt=comment.path + '0'
+        )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if all(comment.pk is not None for comment in objs):
+            assign_paths(objs)
+            return super().bulk_create(objs, *args, **kwargs)
+        # Keys are only known after the INSERT: fill the paths in afterwards,
+        # looking only past the last key that existed before it.
+        last_pk = self.order_by('-pk').values_list('pk', flat=True).first() or 0
+        created = super().bulk_create(objs, *args, **kwargs)
+        pending = assign_paths(
+            self.filter(pk__gt=last_pk, path='').only('pk', 'parent_id')
+        )
+        self.bulk_update(pending, ['path'], batch_size=1000)
+        return created
+
+
+def assign_paths(comments):
+    """Set the path of every comment in `comments`; returns them as a list."""
+    comments = sorted(comments, key=lambda comment: comment.pk)
+    parent_ids = {comment.parent_id for comment in comments if comment.parent_id}
+    paths = dict(
+        Comment.objects.filter(pk__in=parent_ids).values_list('pk', 'path')
+    )
+    for comment in comments:
+        comment.path = comment_path(paths.get(comment.parent_id), comment.pk)
+        paths[comment.pk] = comment.path
+    return comments
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, related_name='replies', blank=True, null=True
+    )
+    path = models.CharField(
+        max_length=(PATH_STEP + 1) * COMMENT_MAX_DEPTH, editable=False
+    )
     text = models.TextField()
     created = models.DateTimeField('date created', auto_now_add=True)
 
+    objects = CommentManager()
+
+    class Meta:
+        # Page through a post's comments, and load whole threads, in path order.
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comment_thread_idx'),
+        ]
+
     def __str__(self):
         return self.text
 
+    @property
+    def depth(self):
+        return self.path.count('/')
+
+    def save(self, *args, **kwargs):
+        # The path ends with our own id, known only after the INSERT.
+        super().save(*args, **kwargs)
+        if not self.path:
+            parent_path = self.parent.path if self.parent_id else None
+            self.path = comment_path(parent_path, self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="follower")
-    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
\ No newline at end of file
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
+
+    class Meta:
+        # One row per pair, so following is idempotent; the pair's index
+        # pages whom a user follows, the reverse one who follows an author.
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'], name='follow_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ]
+
+
+class AuthorStats(models.Model):
+    """
+    Denormalized per-user counters, kept in step with Post and Follow by
+    atomic F() updates in posts.counters.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class FeedItem(models.Model):
+    """
+    Materialized subscription feed: one row per (follower, post), written
+    when the post is published so `/follow/` never joins Follow to Post.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_items')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_items')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'], name='feed_item_user_idx'
+            ),
+            models.Index(fields=['user', 'author'], name='feed_item_author_idx'),
+        ]
+
+
+class EngagementBucket(models.Model):
+    """
+    Engagement with a post during one hour from `start`, added to as
+    comments and follows happen. posts.trending decays and ranks them.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    start = models.DateTimeField()
+    score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'start')
+        indexes = [
+            models.Index(fields=['start'], name='engagement_start_idx'),
+        ]
+
+
+class TrendingPost(models.Model):
+    """
+    Top posts by decayed engagement, rewritten by `compact_trending`: one
+    ranking for the whole site (`group` is NULL) and one per group.
+    """
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, null=True, related_name='+'
+    )
+    rank = models.PositiveSmallIntegerField()
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'rank'], name='trending_rank_idx'),
+        ]
@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __repr__(self):
+        return '<CursorPage of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        if not self.has_next_page:
+            return None
+        return self.paginator.encode(self.object_list[-1], backwards=False)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous_page:
+            return None
+        return self.paginator.encode(self.object_list[0], backwards=True)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination: every page is a seek on the ordering columns
+    (`WHERE (pub_date, id) < (...) ORDER BY ... LIMIT n`), so a page costs
+    the same no matter how deep it is and no COUNT(*) is ever issued.
+
+    `ordering` must be unique across the queryset, hence the trailing `id`.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(name.lstrip('-') for name in self.ordering)
+
+    def get_page(self, cursor=None):
+        position, backwards = self.decode(cursor)
+        try:
+            rows = self.fetch(position, backwards, self.per_page + 1)
+        except (ValidationError, ValueError, TypeError):
+            position, backwards = None, False
+            rows = self.fetch(position, backwards, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return CursorPage(rows, self, has_next=True, has_previous=has_more)
+        return CursorPage(
+            rows, self, has_next=has_more, has_previous=position is not None
+        )
+
+    def fetch(self, position, backwards, limit):
+        """
+        Return up to `limit` rows after `position` in page order (or before
+        it, nearest first, when `backwards`). Subclasses override this to
+        page over sources other than a single queryset.
+        """
+        queryset = self.object_list
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, backwards))
+        return list(queryset.order_by(*self.order_by(backwards))[:limit])
+
+    def order_by(self, backwards=False, ordering=None):
+        ordering = ordering or self.ordering
+        if not backwards:
+            return ordering
+        return tuple(
+            name[1:] if name.startswith('-') else '-' + name
+            for name in ordering
+        )
+
+    def seek(self, position, backwards=False, ordering=None):
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering or self.ordering, position):
+            descending = name.startswith('-')
+            field = name.lstrip('-')
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{'%s__%s' % (field, lookup): value})
+            equal[field] = value
+        return condition
+
+    def key(self, row):
+        if isinstance(row, dict):
+            return tuple(row[field] for field in self.fields)
+        return tuple(getattr(row, field) for field in self.fields)
+
+    def encode(self, row, backwards=False):
+        values = [
+            value.isoformat() if isinstance(value, (date, datetime)) else value
+            for value in self.key(row)
+        ]
+        payload = json.dumps(['p' if backwards else 'n'] + values)
+        token = base64.urlsafe_b64encode(payload.encode())
+        return token.decode().rstrip('=')
+
+    def decode(self, cursor):
+        """
+        Turn a `?cursor=` token back into `(position, backwards)`. Anything
+        malformed falls back to the first page, like `Paginator.get_page`.
+        """
+        if not cursor:
+            return None, False
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError, binascii.Error):
+            return None, False
+        if (
+            not isinstance(payload, list)
+            or len(payload) != len(self.ordering) + 1
+            or payload[0] not in ('n', 'p')
+            or not all(isinstance(v, (str, int, float)) for v in payload[1:])
+        ):
+            return None, False
+        return tuple(payload[1:]), payload[0] == 'p'
@@ -0,0 +1,60 @@
+"""
+Read-through cache of single posts, for `post_view` and `post_edit`.
+
+A post is cached with its author, the author's counters and its group,
+under a key carrying the generations of the author's and the post's
+scopes, the same ones its page is cached by. Every write to what the
+entry holds bumps one of them: edits, deletes, new thumbnails and
+comments (`comments_count`) bump the post, new posts and follows (the
+counters) and profile changes bump the author, and group edits bump
+every post of the group. An entry is never read stale, so it is never
+deleted either: old generations age out.
+
+Unlike the page cache, which keeps a copy per visitor, one entry serves
+every visitor of the post. Of the author it holds only what pages show.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404
+
+from . import authors
+from .authors import get_author_or_404
+from .counters import stats_for
+from .generations import author_scope, get_generations, post_scope
+from .models import AuthorStats, Group, Post
+
+
+# The post, the fields pages show of its author, the author's counters and
+# the group; the password hash, email and permission flags stay out.
+FIELDS = (
+    [field.name for field in Post._meta.concrete_fields]
+    + ['author__%s' % name for name in authors.FIELDS]
+    + ['author__stats__%s' % field.name for field in AuthorStats._meta.concrete_fields]
+    + ['group__%s' % field.name for field in Group._meta.concrete_fields]
+)
+
+
+def _key(username, post_id):
+    generations = get_generations(author_scope(username), post_scope(post_id))
+    return 'post:%s:%s' % (post_id, '.'.join(str(value) for value in generations))
+
+
+def get_post_or_404(username, post_id):
+    """
+    The post `post_id` of `username`, with `author`, `author.stats` and
+    `group` loaded. Only read it: save posts fetched from the database.
+    """
+    key = _key(username, post_id)
+    post = cache.get(key)
+    if post is None:
+        post = get_object_or_404(
+            Post.objects.for_detail().only(*FIELDS),
+            author_id=get_author_or_404(username).pk,
+            pk=post_id,
+        )
+        try:
+            post.author.stats
+        except AuthorStats.DoesNotExist:
+            post.author.stats = stats_for(post.author_id)
+        cache.set(key, post, settings.PAGE_CACHE_TIMEOUT)
+    return post
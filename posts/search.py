@@ -0,0 +1,139 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .paginator import CursorPaginator
+
+FTS_TABLE = 'posts_post_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    Turn free user input into an FTS5 MATCH expression: every word becomes
+    a quoted term (all must match), so operators and stray quotes in the
+    input can never raise a syntax error.
+    """
+    return ' '.join('"%s"' % token for token in TOKEN_RE.findall(query))
+
+
+def index_post(post):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text],
+        )
+
+
+def unindex_post(post_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    """Re-index every post, for writes that bypass signals (bulk_create, update)."""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) SELECT id, text FROM posts_post'
+        )
+
+
+def filter_queryset(queryset, query):
+    """Restrict `queryset` to posts matching `query`, for the admin search."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset
+    if not fts_enabled():
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [expression],
+    ))
+
+
+class SearchPaginator(CursorPaginator):
+    """
+    Ranked full-text results: best bm25 first, paged by cursor on
+    `(rank, id)` straight out of the FTS5 index.
+    """
+
+    def __init__(self, query, per_page, group=None, author=None):
+        super().__init__(Post.objects.none(), per_page, ordering=('rank', 'id'))
+        self.expression = match_expression(query)
+        self.group = group
+        self.author = author
+
+    def fetch(self, position, backwards, limit):
+        if not self.expression:
+            return []
+        sql = [
+            f'SELECT p.id, {FTS_TABLE}.rank FROM {FTS_TABLE}',
+            f'JOIN posts_post p ON p.id = {FTS_TABLE}.rowid',
+            f'WHERE {FTS_TABLE} MATCH %s',
+        ]
+        params = [self.expression]
+        if self.group is not None:
+            sql.append('AND p.group_id = %s')
+            params.append(self.group.pk)
+        if self.author is not None:
+            sql.append('AND p.author_id = %s')
+            params.append(self.author.pk)
+        if position is not None:
+            rank, pk = float(position[0]), int(position[1])
+            op = '<' if backwards else '>'
+            sql.append(
+                f'AND ({FTS_TABLE}.rank {op} %s '
+                f'OR ({FTS_TABLE}.rank = %s AND p.id {op} %s))'
+            )
+            params += [rank, rank, pk]
+        direction = 'DESC' if backwards else 'ASC'
+        sql.append(f'ORDER BY {FTS_TABLE}.rank {direction}, p.id {direction}')
+        sql.append('LIMIT %s')
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            ranked = cursor.fetchall()
+        posts = Post.objects.for_listing().in_bulk([pk for pk, _ in ranked])
+        results = []
+        for pk, rank in ranked:
+            if pk in posts:
+                posts[pk].rank = rank
+                results.append(posts[pk])
+        return results
+
+
+class LikePaginator(CursorPaginator):
+    """Fallback for databases without FTS5: newest matches first."""
+
+    def __init__(self, query, per_page, group=None, author=None):
+        posts = Post.objects.for_listing()
+        for token in TOKEN_RE.findall(query):
+            posts = posts.filter(text__icontains=token)
+        if group is not None:
+            posts = posts.filter(group=group)
+        if author is not None:
+            posts = posts.filter(author=author)
+        if not TOKEN_RE.search(query):
+            posts = posts.none()
+        super().__init__(posts, per_page)
+
+
+def search_paginator(query, per_page, group=None, author=None):
+    paginator_class = SearchPaginator if fts_enabled() else LikePaginator
+    return paginator_class(query, per_page, group=group, author=author)
@@ -0,0 +1,185 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from yatube import db_router
+
+from . import authors, counters, feed, generations, search, thumbnails, trending
+from .models import Comment, Follow, Group, Post, User
+
+
+def invalidate(*scopes):
+    # Bump now so this request sees its own write, and again after commit so
+    # a page cached meanwhile from pre-commit data by another request is
+    # thrown away as well.
+    generations.bump(*scopes)
+    # The writer reads its own change from the primary for a while.
+    db_router.pin()
+    transaction.on_commit(lambda: generations.bump(*scopes))
+
+
+def author_scopes(*user_ids):
+    usernames = User.objects.filter(pk__in=user_ids).values_list('username', flat=True)
+    return [generations.author_scope(username) for username in usernames]
+
+
+def invalidate_post(post_id, author_id, group_ids):
+    group_ids = {group_id for group_id in group_ids if group_id is not None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list('slug', flat=True)
+    invalidate(
+        generations.GLOBAL,
+        generations.post_scope(post_id),
+        *author_scopes(author_id),
+        *[generations.group_scope(slug) for slug in slugs],
+    )
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Read __dict__ directly so a deferred group_id is not fetched.
+    instance._saved_group_id = instance.__dict__.get('group_id')
+    instance._saved_image = str(instance.__dict__.get('image') or '')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    search.index_post(instance)
+    if raw:
+        return
+    invalidate_post(
+        instance.pk, instance.author_id, [instance.group_id, instance._saved_group_id]
+    )
+    if created:
+        counters.add_to_author(instance.author_id, 'posts_count', 1)
+        counters.add(Group, instance.group_id, 'posts_count', 1)
+        feed.fan_out(instance)
+    elif instance._saved_group_id != instance.group_id:
+        counters.add(Group, instance._saved_group_id, 'posts_count', -1)
+        counters.add(Group, instance.group_id, 'posts_count', 1)
+    instance._saved_group_id = instance.group_id
+    if instance.image and str(instance.image) != instance._saved_image:
+        thumbnails.schedule(instance)
+    instance._saved_image = str(instance.image or '')
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+    invalidate_post(instance.pk, instance.author_id, [instance.group_id])
+    counters.add_to_author(instance.author_id, 'posts_count', -1)
+    counters.add(Group, instance.group_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.add(Post, instance.post_id, 'comments_count', 1)
+        trending.record(instance.post_id, trending.COMMENT_WEIGHT)
+    comment_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.add(Post, instance.post_id, 'comments_count', -1)
+    comment_changed(instance)
+
+
+def comment_changed(comment):
+    post = Post.objects.filter(pk=comment.post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    # A missing post is being deleted and invalidates its pages itself.
+    if post is not None:
+        invalidate_post(comment.post_id, post[0], [post[1]])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.add_to_author(instance.author_id, 'followers_count', 1)
+        counters.add_to_author(instance.user_id, 'following_count', 1)
+        feed.backfill(instance.user_id, instance.author_id)
+        trending.record_follow(instance.author_id)
+        invalidate(*author_scopes(instance.author_id, instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.add_to_author(instance.author_id, 'followers_count', -1)
+    counters.add_to_author(instance.user_id, 'following_count', -1)
+    feed.purge(instance.user_id, instance.author_id)
+    invalidate(*author_scopes(instance.author_id, instance.user_id))
+
+
+def post_scopes(posts):
+    return [
+        generations.post_scope(post_id)
+        for post_id in posts.values_list('pk', flat=True).distinct()
+    ]
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    scopes = [generations.group_scope(instance.slug)]
+    # The title is shown on the posts wherever they are listed. A deleted
+    # group takes its posts along, and they invalidate their own pages.
+    if kwargs['signal'] is post_save and not created:
+        scopes += [generations.GLOBAL, *post_scopes(instance.group_posts.all())]
+    invalidate(*scopes)
+
+
+def shown_names(user):
+    """What pages show of a user next to their posts and comments."""
+    return tuple(user.__dict__.get(name) for name in authors.FIELDS[1:])
+
+
+def pages_showing(user_id):
+    """Scopes of the pages that show a user next to their posts and comments."""
+    posts = Post.objects.filter(author_id=user_id)
+    commented = Post.objects.filter(comments__author_id=user_id)
+    slugs = posts.exclude(group=None).values_list('group__slug', flat=True).distinct()
+    followed = Follow.objects.filter(user_id=user_id).values_list('author_id', flat=True)
+    followers = Follow.objects.filter(author_id=user_id).values_list('user_id', flat=True)
+    return [
+        generations.GLOBAL,
+        *post_scopes(posts),
+        *post_scopes(commented),
+        *[generations.group_scope(slug) for slug in slugs],
+        # Follow lists of the other side.
+        *author_scopes(*followed, *followers),
+    ]
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._saved_username = instance.__dict__.get('username')
+    instance._saved_names = shown_names(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, raw=False, created=False, update_fields=None,
+                 **kwargs):
+    # Logging in only touches last_login, which no page shows.
+    if raw or update_fields == frozenset(['last_login']):
+        return
+    # A renamed user leaves its old name too, and a new one takes a name
+    # that may be remembered as unknown.
+    # Forgotten again after commit, like `invalidate` bumps twice.
+    names = {instance.username, instance._saved_username} - {None}
+    authors.forget(*names)
+    transaction.on_commit(lambda: authors.forget(*names))
+    scopes = [generations.author_scope(name) for name in names]
+    # A new user has nothing on other pages yet; a deleted one takes its
+    # posts and comments along.
+    renamed = shown_names(instance) != instance._saved_names
+    if kwargs['signal'] is post_save and not created and renamed:
+        scopes += pages_showing(instance.pk)
+    instance._saved_username = instance.username
+    instance._saved_names = shown_names(instance)
+    invalidate(*scopes)
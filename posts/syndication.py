@@ -0,0 +1,179 @@
+"""
+Atom, RSS and JSON Feed documents for the index, group and author pages.
+
+Documents are streamed entry by entry, and the views answer conditional
+requests from one MAX(pub_date) lookup, so a polling reader that is up to
+date costs no rendering at all.
+"""
+import json
+from io import StringIO
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.text import Truncator
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from .authors import get_author_or_404
+from .models import Post
+
+FEED_ITEMS = 20
+
+
+class StreamingFeedMixin:
+    """
+    Adds `stream(items)` to an XML feed generator: yields the document a
+    piece at a time while consuming `items`, a lazy iterable of item dicts.
+    Each feed opens and closes its root elements in `start_document(handler)`
+    and `end_document(handler)`.
+    """
+
+    def latest_post_date(self):
+        return self.feed.get('updated') or super().latest_post_date()
+
+    def stream(self, items):
+        buffer = StringIO()
+        handler = SimplerXMLGenerator(buffer, 'utf-8')
+
+        def flush():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+
+        handler.startDocument()
+        self.start_document(handler)
+        self.add_root_elements(handler)
+        yield flush()
+        for item in items:
+            self.items = [item]
+            self.write_items(handler)
+            yield flush()
+        self.end_document(handler)
+        yield flush()
+
+
+class AtomFeed(StreamingFeedMixin, feedgenerator.Atom1Feed):
+    def start_document(self, handler):
+        handler.startElement('feed', self.root_attributes())
+
+    def end_document(self, handler):
+        handler.endElement('feed')
+
+
+class RssFeed(StreamingFeedMixin, feedgenerator.Rss201rev2Feed):
+    def start_document(self, handler):
+        handler.startElement('rss', self.rss_attributes())
+        handler.startElement('channel', self.root_attributes())
+
+    def end_document(self, handler):
+        self.endChannelElement(handler)
+        handler.endElement('rss')
+
+
+class JSONFeed(feedgenerator.SyndicationFeed):
+    """JSON Feed 1.1, https://jsonfeed.org/version/1.1"""
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def stream(self, items):
+        header = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'language': self.feed['language'],
+        }
+        yield json.dumps(header, ensure_ascii=False)[:-1] + ', "items": ['
+        separator = ''
+        for item in items:
+            yield separator + json.dumps(self.item_dict(item), ensure_ascii=False)
+            separator = ', '
+        yield ']}'
+
+    def item_dict(self, item):
+        data = {
+            'id': item['unique_id'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_text': item['description'],
+            'date_published': item['pubdate'].isoformat(),
+            'authors': [{'name': item['author_name'], 'url': item['author_link']}],
+        }
+        if item['categories']:
+            data['tags'] = list(item['categories'])
+        return data
+
+    def write(self, outfile, encoding):
+        for chunk in self.stream(self.items):
+            outfile.write(chunk)
+
+
+FEED_FORMATS = {'atom': AtomFeed, 'rss': RssFeed, 'json': JSONFeed}
+
+
+def scoped_posts(slug=None, username=None):
+    posts = Post.objects.all()
+    if slug is not None:
+        posts = posts.filter(group__slug=slug)
+    if username is not None:
+        posts = posts.filter(author_id=get_author_or_404(username).pk)
+    return posts
+
+
+def feed_updated(request, format, **scope):
+    """Newest pub_date in the feed, looked up once per request."""
+    if not hasattr(request, '_feed_updated'):
+        request._feed_updated = scoped_posts(**scope).aggregate(
+            updated=Max('pub_date')
+        )['updated']
+    return request._feed_updated
+
+
+def feed_etag(request, format, **scope):
+    updated = feed_updated(request, format, **scope)
+    if updated is None:
+        return None
+    return '"%s-%d"' % (format, updated.timestamp() * 1000000)
+
+
+def feed_item(feed, request, post):
+    link = request.build_absolute_uri(
+        reverse('post', args=[post.author.username, post.pk])
+    )
+    feed.add_item(
+        title=Truncator(post.text).words(8),
+        link=link,
+        description=post.text,
+        author_name=post.author.get_full_name() or post.author.username,
+        author_link=request.build_absolute_uri(
+            reverse('profile', args=[post.author.username])
+        ),
+        pubdate=post.pub_date,
+        unique_id=link,
+        categories=[post.group.title] if post.group else (),
+    )
+    return feed.items.pop()
+
+
+def feed_response(request, format, posts, title, link, description, updated=None):
+    try:
+        feed_class = FEED_FORMATS[format]
+    except KeyError:
+        raise Http404
+    feed = feed_class(
+        title=title,
+        link=request.build_absolute_uri(link),
+        description=description,
+        feed_url=request.build_absolute_uri(),
+        language=settings.LANGUAGE_CODE,
+        updated=updated,
+    )
+    posts = (
+        posts.select_related('author', 'group')
+        .order_by('-pub_date', '-id')[:FEED_ITEMS]
+    )
+    items = (feed_item(feed, request, post) for post in posts.iterator())
+    return StreamingHttpResponse(feed.stream(items), content_type=feed.content_type)
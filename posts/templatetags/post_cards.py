@@ -0,0 +1,52 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from posts.generations import get_generations, post_scope
+
+register = template.Library()
+
+TEMPLATE = 'post_item.html'
+
+
+def card_key(post, version, user):
+    # The version is the post's generation, bumped on edits, comments and
+    # new thumbnails. Author and group names are not, so they go in too,
+    # and so does the edit link only the author gets.
+    own = bool(user is not None and user.is_authenticated and user.pk == post.author_id)
+    group = post.group
+    shown = '|'.join([
+        post.author.username,
+        group.slug if group else '',
+        group.title if group else '',
+        str(own),
+    ])
+    digest = hashlib.md5(shown.encode()).hexdigest()
+    return 'post_card:%s:%s:%s' % (post.pk, version, digest)
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """
+    The `post_item.html` card of every post in `posts`. All the versions
+    and cached cards are read at once; only the missing ones are rendered.
+    """
+    posts = list(posts)
+    if not posts:
+        return ''
+    versions = get_generations(*[post_scope(post.pk) for post in posts])
+    user = context.get('user')
+    keys = [card_key(post, version, user) for post, version in zip(posts, versions)]
+    cards = cache.get_many(keys)
+    rendered = {}
+    item = context.template.engine.get_template(TEMPLATE)
+    for post, key in zip(posts, keys):
+        if key not in cards:
+            with context.push(post=post, detail=False):
+                cards[key] = rendered[key] = item.render(context)
+    if rendered:
+        cache.set_many(rendered, settings.PAGE_CACHE_TIMEOUT)
+    return mark_safe(''.join(cards[key] for key in keys))
@@ -0,0 +1,27 @@
+from urllib.parse import quote
+
+from django import template
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, size):
+    """Ready thumbnail of `image`, or None while the worker pool renders it."""
+    if not image:
+        return None
+    return thumbnails.cached_thumbnail(image, size)
+
+
+@register.simple_tag
+def thumbnail_placeholder(size):
+    geometry, _ = thumbnails.geometries()[size]
+    width, height = parse_geometry(geometry)
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+        f'<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+    )
+    return 'data:image/svg+xml,' + quote(svg)
@@ -1,17 +1,62 @@
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client
-from .models import Post, User, Group, Follow, Comment
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory
+from .models import Post, User, Group, Follow, Comment, FeedItem, AuthorStats
+from .models import EngagementBucket, TrendingPost
+from .models import COMMENT_MAX_DEPTH, EXCERPT_LENGTH
+from .views import COMMENTS_PER_PAGE, FOLLOWS_PER_PAGE
+from .paginator import CursorPaginator
+from . import authors, benchmark, generations, post_cache, thumbnails, trending
+from yatube.db_router import PIN_COOKIE
+from yatube import ratelimit
+from yatube.sqlite_cache import SQLiteCache
+from yatube.sqlite_backend import base as sqlite_backend
 from django.urls import reverse
 from django.core.cache import cache
-from io import BytesIO
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
 from PIL import Image
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.files.temp import NamedTemporaryFile
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 DUMMY_CACHE = {
     'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
 }
 
+# The suite keeps off the cache file the running site uses, and requests
+# are only sampled by the tests of the metrics themselves.
+TEST_SETTINGS = override_settings(
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    },
+    REQUEST_METRICS_SAMPLE_RATE = 0,
+)
+
+
+def setUpModule():
+    TEST_SETTINGS.enable()
+
+
+def tearDownModule():
+    TEST_SETTINGS.disable()
+
+
 class NotAuthotizedTests(TestCase):
     def SetUp(self):
         self.client = Client()
@@ -88,9 +133,9 @@ class AuthorizedTests(TestCase):
         if response.context.get('paginator') is None:
             post = response.context.get('post')
         else:
-            p = response.context['paginator']
-            self.assertEqual(1, p.count)
-            post = response.context['page'][0]
+            page = response.context['page']
+            self.assertEqual(1, len(page))
+            post = page[0]
 
         self.assertEqual(post.text, text)
         self.assertEqual(post.author, author)
@@ -146,7 +191,7 @@ class AuthorizedTests(TestCase):
             self.contains_check(url, new_text, self.myuser, self.group2)
         
         response = self.client.get(reverse('group', kwargs={'slug': self.group1.slug}))
-        self.assertEqual(response.context['paginator'].count, 0)
+        self.assertEqual(len(response.context['page']), 0)
 
     @override_settings(CACHES = DUMMY_CACHE)
     def test_ImageExists(self):
@@ -274,7 +319,7 @@ class AuthorizedTests(TestCase):
         response = self.client.get(
             reverse('follow_index')
         )
-        self.assertEqual(response.context['paginator'].count, 0)
+        self.assertEqual(len(response.context['page']), 0)
     
     def test_AuthUserCanComment(self):
         test_text = 'Just wanted to talk to you about baba'
@@ -311,6 +356,7 @@ class CodesTests(TestCase):
 class CacheTest(TestCase):
     
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.myuser = User.objects.create(
             username = 'biba', 
@@ -329,16 +375,1327 @@ class CacheTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, test_text)
 
+        response = self.client.get(reverse('index'))
+        self.assertIsNone(response.context)
+        self.assertContains(response, test_text)
+
         self.client.post(
             reverse('post_edit', args=[self.myuser.username, post.id]), 
             {'text': new_text, }, 
             Follow=True
         )        
         response = self.client.get(reverse('index'))
-        self.assertNotContains(response, new_text)
-        cache.clear()
-        response = self.client.get(reverse('index'))
         self.assertContains(response, new_text)
+
+    def test_group_and_author_renames_reach_every_page(self):
+        group = Group.objects.create(title = 'Cats', slug = 'cats')
+        author = User.objects.create(username = 'avtor', password = 'avtor')
+        post = Post.objects.create(text = 'kotik', author = author, group = group)
+        Comment.objects.create(post = post, author = self.myuser, text = 'koment')
+        urls = [
+            reverse('index'),
+            reverse('group', args = ['cats']),
+            reverse('post', args = ['avtor', post.id]),
+        ]
+        visitor = Client()
+        for url in urls:
+            visitor.get(url)
+            self.assertIsNone(visitor.get(url).context)
+
+        group.title = 'Koshki'
+        group.save()
+        for url in urls:
+            self.assertContains(visitor.get(url), 'Koshki')
+
+        self.myuser.username = 'pupa'
+        self.myuser.save()
+        response = visitor.get(urls[2])
+        self.assertContains(response, '>pupa<')
+        self.assertNotContains(response, '>biba<')
+
+        author.first_name = 'Lev'
+        author.save()
+        self.assertContains(visitor.get(urls[2]), 'Lev')
+
+    def test_signup_and_login_keep_shared_pages(self):
+        visitor = Client()
+        visitor.get(reverse('index'))
+        User.objects.create(username = 'newbie', password = 'newbie')
+        self.myuser.save(update_fields = ['last_login'])
+        self.assertIsNone(visitor.get(reverse('index')).context)
+
+    def test_writes_invalidate_only_their_scopes(self):
+        author = User.objects.create(username = 'avtor', password = 'avtor')
+        post = Post.objects.create(text = 'wasd', author = self.myuser)
+        urls = {
+            'own': reverse('profile', args = [self.myuser.username]),
+            'other': reverse('profile', args = [author.username]),
+            'post': reverse('post', args = [self.myuser.username, post.id]),
+        }
+        # The first page with a form hands out the CSRF cookie; pages are
+        # cached for the session and that cookie from then on.
+        self.client.get(urls['post'])
+        for url in urls.values():
+            self.client.get(url)
+
+        self.client.post(
+            reverse('add_comment', args = [self.myuser.username, post.id]),
+            {'text': 'koment'}
+        )
+        self.assertIsNotNone(self.client.get(urls['own']).context)
+        self.assertIsNotNone(self.client.get(urls['post']).context)
+        self.assertIsNone(self.client.get(urls['other']).context)
+
+        self.client.get(reverse('profile_follow', args = [author.username]))
+        self.assertIsNotNone(self.client.get(urls['other']).context)
+
+    def test_page_handing_out_a_csrf_cookie_is_not_stored(self):
+        post = Post.objects.create(text = 'wasd', author = self.myuser)
+        url = reverse('post', args = [self.myuser.username, post.id])
+        response = self.client.get(url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+        # Without the cookie the stored page would sign its form with a
+        # secret this visitor never received.
+        del self.client.cookies[settings.CSRF_COOKIE_NAME]
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_cached_page_is_not_shared_between_visitors(self):
+        bob = User.objects.create(username = 'bob', password = 'bob')
+        post = Post.objects.create(text = 'wasd', author = self.myuser)
+        bob_client = Client()
+        bob_client.force_login(bob)
+        for url in (
+            reverse('profile', args = [self.myuser.username]),
+            reverse('post', args = [self.myuser.username, post.id]),
+        ):
+            self.client.get(url)
+            self.assertContains(self.client.get(url), 'Пользователь: biba')
+            self.assertIsNone(self.client.get(url).context)
+
+            response = bob_client.get(url)
+            self.assertIsNotNone(response.context)
+            self.assertContains(response, 'Пользователь: bob')
+            self.assertNotContains(response, 'Пользователь: biba')
+
+            response = Client().get(url)
+            self.assertIsNotNone(response.context)
+            self.assertNotContains(response, 'Пользователь:')
         
         
-                
\ No newline at end of file
+class ListingQuerySetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.long_text = 'slovo ' * 100
+
+    def test_excerpt_is_stored_on_save_and_bulk_create(self):
+        post = Post.objects.create(text = self.long_text, author = self.myuser)
+        self.assertEqual(len(post.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(post.excerpt.endswith('…'))
+        Post.objects.bulk_create([Post(text = 'short', author = self.myuser)])
+        self.assertEqual(Post.objects.get(text = 'short').excerpt, 'short')
+
+    def test_listing_shows_excerpt_and_detail_full_text(self):
+        post = Post.objects.create(text = self.long_text, author = self.myuser)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, post.excerpt)
+        self.assertNotContains(response, self.long_text.strip())
+        response = self.client.get(reverse('post', args = ['biba', post.id]))
+        self.assertContains(response, self.long_text.strip())
+
+    def test_for_listing_defers_text(self):
+        Post.objects.create(text = 'post', author = self.myuser)
+        with self.assertNumQueries(1):
+            post = Post.objects.for_listing().get()
+            self.assertEqual(post.author.username, 'biba')
+        self.assertIn('text', post.get_deferred_fields())
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.post = Post.objects.create(text = 'post', author = self.myuser)
+        self.client.force_login(self.myuser)
+
+    def comment(self, text, parent = None):
+        return Comment.objects.create(
+            post = self.post, author = self.myuser, text = text, parent = parent
+        )
+
+    def test_paths_list_threads_depth_first(self):
+        first = self.comment('first')
+        second = self.comment('second')
+        reply = self.comment('reply', parent = first)
+        nested = self.comment('nested', parent = reply)
+        self.assertEqual(nested.path, '%s/%010d' % (reply.path, nested.pk))
+        self.assertEqual(nested.depth, 2)
+        ordered = Comment.objects.filter(post = self.post).order_by('path')
+        self.assertEqual(
+            [c.text for c in ordered], ['first', 'reply', 'nested', 'second']
+        )
+        thread = Comment.objects.thread(first).order_by('path')
+        self.assertEqual([c.text for c in thread], ['first', 'reply', 'nested'])
+
+    def test_bulk_create_fills_paths(self):
+        parent = self.comment('parent')
+        Comment.objects.bulk_create([
+            Comment(post = self.post, author = self.myuser, text = 'child', parent = parent),
+        ])
+        child = Comment.objects.get(text = 'child')
+        self.assertEqual(child.path, '%s/%010d' % (parent.path, child.pk))
+
+    def test_bulk_create_fills_only_the_new_rows(self):
+        old = self.comment('old')
+        Comment.objects.filter(pk = old.pk).update(path = '')
+        with self.assertNumQueries(4):
+            Comment.objects.bulk_create([
+                Comment(post = self.post, author = self.myuser, text = 'new'),
+            ])
+        self.assertEqual(Comment.objects.get(pk = old.pk).path, '')
+        self.assertNotEqual(Comment.objects.get(text = 'new').path, '')
+
+    def test_reply_link_fills_in_the_parent(self):
+        first = self.comment('first')
+        url = reverse('post', args = ['biba', self.post.id])
+        response = self.client.get(url, {'reply': first.id})
+        self.assertContains(response, 'name="parent" value="%s"' % first.id)
+        self.assertContains(response, 'Ответ для @biba')
+        response = self.client.get(url, {'reply': 'x'})
+        self.assertContains(response, 'Добавить комментарий')
+
+    def test_reply_through_form_is_capped_at_max_depth(self):
+        parent = None
+        for depth in range(COMMENT_MAX_DEPTH):
+            parent = self.comment('level %s' % depth, parent = parent)
+        self.client.post(
+            reverse('add_comment', args = ['biba', self.post.id]),
+            {'text': 'too deep', 'parent': parent.id},
+        )
+        reply = Comment.objects.get(text = 'too deep')
+        self.assertEqual(reply.parent, parent.parent)
+        self.assertEqual(reply.depth, COMMENT_MAX_DEPTH - 1)
+
+    def test_fragment_pages_by_cursor(self):
+        for i in range(COMMENTS_PER_PAGE + 5):
+            self.comment('koment %s' % i)
+        response = self.client.get(reverse('post', args = ['biba', self.post.id]))
+        self.assertContains(response, 'koment %s' % (COMMENTS_PER_PAGE - 1))
+        self.assertNotContains(response, 'koment %s' % COMMENTS_PER_PAGE)
+        url = reverse('post_comments', args = ['biba', self.post.id])
+        cursor = response.context['comments_page'].next_cursor
+        self.assertContains(response, '%s?cursor=%s' % (url, cursor))
+
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertContains(response, 'koment %s' % (COMMENTS_PER_PAGE + 4))
+        self.assertNotContains(response, 'koment 0<')
+        self.assertNotContains(response, 'comments-more')
+
+    def test_fragment_of_one_thread(self):
+        first = self.comment('first')
+        self.comment('reply', parent = first)
+        self.comment('second')
+        response = self.client.get(
+            reverse('post_comments', args = ['biba', self.post.id]), {'thread': first.id}
+        )
+        self.assertContains(response, 'reply')
+        self.assertNotContains(response, 'second')
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(
+            username = 'biba',
+            password = 'boba'
+        )
+        for i in range(25):
+            Post.objects.create(text = f'post {i}', author = self.myuser)
+
+    def walk(self, page, cursor_attr):
+        texts = []
+        while page is not None:
+            texts.extend(post.text for post in page)
+            cursor = getattr(page, cursor_attr)
+            page = page.paginator.get_page(cursor) if cursor else None
+        return texts
+
+    def test_next_pages_cover_every_post_once(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page(None)
+        self.assertFalse(page.has_previous())
+        texts = self.walk(page, 'next_cursor')
+        self.assertEqual(texts, [f'post {i}' for i in reversed(range(25))])
+
+    def test_previous_cursor_returns_to_earlier_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        for cursor in ('garbage', 'WyJuIiwgIngiLCAxXQ'):
+            page = paginator.get_page(cursor)
+            self.assertEqual(page[0].text, 'post 24')
+
+    def test_index_uses_cursor_links(self):
+        response = self.client.get(reverse('index'))
+        next_cursor = response.context['page'].next_cursor
+        self.assertContains(response, f'?cursor={next_cursor}')
+        response = self.client.get(reverse('index'), {'cursor': next_cursor})
+        self.assertEqual(response.context['page'][0].text, 'post 14')
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.client.force_login(self.myuser)
+
+    def feed_texts(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        Follow.objects.create(user = self.myuser, author = self.author)
+        post = Post.objects.create(text = 'fresh', author = self.author)
+        self.assertTrue(
+            FeedItem.objects.filter(user = self.myuser, post = post).exists()
+        )
+        self.assertEqual(self.feed_texts(), ['fresh'])
+
+    def test_follow_backfills_and_unfollow_purges(self):
+        Post.objects.create(text = 'old', author = self.author)
+        self.client.get(reverse('profile_follow', args = [self.author]))
+        self.assertEqual(self.feed_texts(), ['old'])
+        self.client.get(reverse('profile_unfollow', args = [self.author]))
+        self.assertEqual(FeedItem.objects.count(), 0)
+        self.assertEqual(self.feed_texts(), [])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS = 0)
+    def test_celebrity_posts_are_pulled_and_merged(self):
+        regular = User.objects.create(username = 'regular', password = 'regular')
+        Follow.objects.create(user = self.myuser, author = self.author)
+        Follow.objects.create(user = self.myuser, author = regular)
+        Post.objects.create(text = 'first', author = self.author)
+        Post.objects.create(text = 'second', author = regular)
+        Post.objects.create(text = 'third', author = self.author)
+        self.assertEqual(FeedItem.objects.count(), 0)
+        self.assertEqual(self.feed_texts(), ['third', 'second', 'first'])
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.client.force_login(self.myuser)
+
+    def test_follow_is_idempotent(self):
+        url = reverse('profile_follow', args = [self.author])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(AuthorStats.objects.get(user = self.author).followers_count, 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user = self.myuser, author = self.author)
+
+        unfollow = reverse('profile_unfollow', args = [self.author])
+        self.client.get(unfollow)
+        self.client.get(unfollow)
+        self.assertEqual(Follow.objects.count(), 0)
+        self.assertEqual(AuthorStats.objects.get(user = self.author).followers_count, 0)
+
+    def test_cannot_follow_self(self):
+        self.client.get(reverse('profile_follow', args = [self.myuser]))
+        self.assertEqual(Follow.objects.count(), 0)
+
+    def test_followers_pages_by_cursor(self):
+        names = ['follower%s' % i for i in range(FOLLOWS_PER_PAGE + 2)]
+        for name in names:
+            user = User.objects.create(username = name, password = name)
+            Follow.objects.create(user = user, author = self.author)
+        url = reverse('profile_followers', args = [self.author])
+        response = self.client.get(url)
+        seen = [user.username for user in response.context['users']]
+        self.assertEqual(len(seen), FOLLOWS_PER_PAGE)
+        response = self.client.get(url, {'cursor': response.context['page'].next_cursor})
+        seen += [user.username for user in response.context['users']]
+        self.assertEqual(sorted(seen), sorted(names))
+        self.assertFalse(response.context['page'].has_next())
+
+    def test_following_page_lists_authors(self):
+        Follow.objects.create(user = self.myuser, author = self.author)
+        response = self.client.get(reverse('profile_following', args = [self.myuser]))
+        self.assertContains(response, '@avtor')
+        response = self.client.get(reverse('profile_followers', args = [self.author]))
+        self.assertContains(response, '@biba')
+
+    def test_follow_lists_are_cached_per_visitor(self):
+        other = Client()
+        other.force_login(self.author)
+        for name in ('profile_followers', 'profile_following'):
+            url = reverse(name, args = [self.author])
+            self.client.get(url)
+            response = self.client.get(url)
+            self.assertIsNone(response.context)
+            self.assertContains(response, 'Пользователь: biba')
+
+            response = other.get(url)
+            self.assertIsNotNone(response.context)
+            self.assertContains(response, 'Пользователь: avtor')
+            self.assertNotContains(response, 'Пользователь: biba')
+
+
+class AuthorCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(
+            username = 'avtor', password = 'avtor', first_name = 'Leo'
+        )
+
+    def test_hits_and_misses_are_cached(self):
+        with self.assertNumQueries(1):
+            author = authors.get_author_or_404('avtor')
+        with self.assertNumQueries(0):
+            self.assertEqual(authors.get_author_or_404('avtor'), author)
+        self.assertEqual(author.first_name, 'Leo')
+        with self.assertNumQueries(1), self.assertRaises(Http404):
+            authors.get_author_or_404('nobody')
+        with self.assertNumQueries(0), self.assertRaises(Http404):
+            authors.get_author_or_404('nobody')
+        self.assertEqual(self.client.get('/nobody/').status_code, 404)
+
+    def test_save_and_delete_forget_the_name(self):
+        with self.assertRaises(Http404):
+            authors.get_author_or_404('newbie')
+        newbie = User.objects.create(username = 'newbie', password = 'newbie')
+        self.assertEqual(authors.get_author_or_404('newbie'), newbie)
+
+        self.author.username = 'renamed'
+        self.author.save()
+        with self.assertRaises(Http404):
+            authors.get_author_or_404('avtor')
+        self.assertEqual(authors.get_author_or_404('renamed').pk, self.author.pk)
+
+        newbie.delete()
+        with self.assertRaises(Http404):
+            authors.get_author_or_404('newbie')
+
+    def test_saving_a_cached_author_keeps_other_fields(self):
+        author = authors.get_author_or_404('avtor')
+        author.last_name = 'Tolstoy'
+        author.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.last_name, 'Tolstoy')
+        self.assertEqual(self.author.password, 'avtor')
+
+
+class PostCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.group = Group.objects.create(title = 'Cats', slug = 'cats')
+        self.post = Post.objects.create(
+            text = 'kotik', author = self.author, group = self.group
+        )
+
+    def get(self):
+        return post_cache.get_post_or_404('avtor', self.post.id)
+
+    def test_warm_post_needs_no_queries(self):
+        self.get()
+        with self.assertNumQueries(0):
+            post = self.get()
+            self.assertEqual(post.text, 'kotik')
+            self.assertEqual(post.author.username, 'avtor')
+            self.assertEqual(post.author.stats.posts_count, 1)
+            self.assertEqual(post.group.title, 'Cats')
+        for name in ('password', 'email', 'is_staff', 'is_superuser', 'last_login'):
+            self.assertNotIn(name, post.author.__dict__)
+
+    def test_writes_replace_the_cached_post(self):
+        self.get()
+        Comment.objects.create(post = self.post, author = self.author, text = 'hi')
+        self.assertEqual(self.get().comments_count, 1)
+
+        self.client.force_login(self.author)
+        self.client.post(
+            reverse('post_edit', args = ['avtor', self.post.id]),
+            {'text': 'pesik', 'group': self.group.id},
+        )
+        self.assertEqual(self.get().text, 'pesik')
+
+        Post.objects.create(text = 'second', author = self.author)
+        self.assertEqual(self.get().author.stats.posts_count, 2)
+
+        group = Group.objects.get(pk = self.group.pk)
+        group.title = 'Dogs'
+        group.save()
+        self.assertEqual(self.get().group.title, 'Dogs')
+
+        self.post.delete()
+        with self.assertRaises(Http404):
+            self.get()
+
+    def test_shared_between_visitors(self):
+        self.client.get(reverse('post', args = ['avtor', self.post.id]))
+        reader = Client()
+        reader.force_login(User.objects.create(username = 'biba', password = 'boba'))
+        with CaptureQueriesContext(connection) as queries:
+            response = reader.get(reverse('post', args = ['avtor', self.post.id]))
+        self.assertContains(response, 'kotik')
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'FROM "posts_post"' in query['sql']
+        ])
+
+
+class PostCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.post = Post.objects.create(text = 'kotik', author = self.author)
+
+    def index(self, client = None):
+        # A new global generation: the page is rendered again, cards are not.
+        generations.bump(generations.GLOBAL)
+        return (client or self.client).get(reverse('index'))
+
+    def test_unchanged_cards_are_reused(self):
+        self.assertContains(self.index(), 'kotik')
+        Post.objects.filter(pk = self.post.pk).update(excerpt = 'sneaky')
+        response = self.index()
+        self.assertContains(response, 'kotik')
+        self.assertNotContains(response, 'sneaky')
+
+    def test_edit_and_comment_rerender_the_card(self):
+        self.index()
+        self.post.text = 'pesik'
+        self.post.save()
+        self.assertContains(self.index(), 'pesik')
+        Comment.objects.create(post = self.post, author = self.author, text = 'hi')
+        self.assertContains(self.index(), '1 комментариев')
+
+    def test_edit_link_only_for_the_author(self):
+        self.assertNotContains(self.index(), 'Редактировать')
+        self.client.force_login(self.author)
+        self.assertContains(self.index(), 'Редактировать')
+        reader = Client()
+        reader.force_login(User.objects.create(username = 'biba', password = 'boba'))
+        self.assertNotContains(self.index(reader), 'Редактировать')
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.reader = User.objects.create(username = 'biba', password = 'boba')
+        self.group = Group.objects.create(title = 'Cats', slug = 'cats')
+        self.quiet = Post.objects.create(text = 'quiet', author = self.author)
+        self.busy = Post.objects.create(
+            text = 'busy', author = self.author, group = self.group
+        )
+
+    def comment(self, post, count = 1):
+        for _ in range(count):
+            Comment.objects.create(post = post, author = self.reader, text = 'hi')
+
+    def test_comments_and_follows_fill_hourly_buckets(self):
+        self.comment(self.busy, 3)
+        Follow.objects.create(user = self.reader, author = self.author)
+        bucket = EngagementBucket.objects.get()
+        self.assertEqual(bucket.post, self.busy)
+        self.assertEqual(
+            bucket.score, 3 * trending.COMMENT_WEIGHT + trending.FOLLOW_WEIGHT
+        )
+
+    def test_compaction_ranks_site_and_groups(self):
+        self.comment(self.quiet)
+        self.comment(self.busy, 2)
+        call_command('compact_trending', stdout = StringIO())
+        self.assertEqual(trending.ranked(), [self.busy, self.quiet])
+        self.assertEqual(trending.ranked(self.group), [self.busy])
+
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(list(response.context['posts']), [self.busy, self.quiet])
+        response = self.client.get(reverse('group', args = ['cats']))
+        self.assertEqual(response.context['trending'], [self.busy])
+
+    def test_old_engagement_decays_and_expires(self):
+        now = timezone.now()
+        trending.record(self.busy.id, 10, now - timedelta(hours = 24))
+        trending.record(self.quiet.id, 2, now)
+        trending.record(self.busy.id, 100, now - timedelta(days = 30))
+        self.assertEqual(trending.compact(now), 2)
+        self.assertEqual(trending.ranked(), [self.quiet, self.busy])
+        self.assertEqual(EngagementBucket.objects.count(), 2)
+
+    def test_compaction_refreshes_cached_page(self):
+        self.assertEqual(list(self.client.get(reverse('trending')).context['posts']), [])
+        self.comment(self.busy)
+        trending.compact()
+        response = self.client.get(reverse('trending'))
+        self.assertContains(response, 'busy')
+
+    def test_compaction_bumps_only_changed_rankings(self):
+        dogs = Group.objects.create(title = 'Dogs', slug = 'dogs')
+        pesik = Post.objects.create(text = 'pesik', author = self.author, group = dogs)
+        gav = Post.objects.create(text = 'gav', author = self.author, group = dogs)
+        self.comment(self.busy, 5)
+        self.comment(gav, 2)
+        self.comment(pesik)
+        trending.compact()
+        scopes = [
+            generations.TRENDING,
+            generations.group_scope('cats'),
+            generations.group_scope('dogs'),
+        ]
+        before = generations.get_generations(*scopes)
+        trending.compact()
+        self.assertEqual(generations.get_generations(*scopes), before)
+
+        # pesik overtakes gav: the site and the dogs' rankings change, the
+        # cats' one does not.
+        self.comment(pesik, 2)
+        trending.compact()
+        after = generations.get_generations(*scopes)
+        self.assertNotEqual(after[0], before[0])
+        self.assertEqual(after[1], before[1])
+        self.assertNotEqual(after[2], before[2])
+        self.assertEqual(trending.ranked(dogs), [pesik, gav])
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.group1 = Group.objects.create(title = 'g1', slug = 'g1', description = 'g1')
+        self.group2 = Group.objects.create(title = 'g2', slug = 'g2', description = 'g2')
+        self.client.force_login(self.myuser)
+
+    def test_write_paths_keep_counters(self):
+        self.client.post(reverse('new_post'), {'text': 'hello', 'group': self.group1.id})
+        post = Post.objects.get()
+        self.client.post(
+            reverse('add_comment', args = [self.myuser.username, post.id]),
+            {'text': 'koment'}
+        )
+        self.client.get(reverse('profile_follow', args = [self.author]))
+
+        post.refresh_from_db()
+        self.group1.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group1.posts_count, 1)
+        self.assertEqual(self.myuser.stats.posts_count, 1)
+        self.assertEqual(self.myuser.stats.following_count, 1)
+        self.assertEqual(AuthorStats.objects.get(user = self.author).followers_count, 1)
+
+        self.client.get(reverse('profile_unfollow', args = [self.author]))
+        self.assertEqual(AuthorStats.objects.get(user = self.author).followers_count, 0)
+
+    def test_group_change_and_delete_move_counters(self):
+        post = Post.objects.create(text = 'hello', author = self.myuser, group = self.group1)
+        post = Post.objects.get(pk = post.pk)
+        post.group = self.group2
+        post.save()
+        self.group1.refresh_from_db()
+        self.group2.refresh_from_db()
+        self.assertEqual((self.group1.posts_count, self.group2.posts_count), (0, 1))
+
+        post.delete()
+        self.group2.refresh_from_db()
+        self.assertEqual(self.group2.posts_count, 0)
+        self.assertEqual(AuthorStats.objects.get(user = self.myuser).posts_count, 0)
+
+    def test_drifted_counters_do_not_fail_deletes(self):
+        post = Post.objects.create(text = 'hello', author = self.myuser, group = self.group1)
+        Comment.objects.create(post = post, author = self.myuser, text = 'koment')
+        Follow.objects.create(user = self.myuser, author = self.author)
+        Post.objects.filter(pk = post.pk).update(comments_count = 0)
+        Group.objects.filter(pk = self.group1.pk).update(posts_count = 0)
+        AuthorStats.objects.update(posts_count = 0, followers_count = 0, following_count = 0)
+
+        Comment.objects.get().delete()
+        self.client.get(reverse('profile_unfollow', args = [self.author]))
+        post.delete()
+        self.group1.refresh_from_db()
+        self.assertEqual(self.group1.posts_count, 0)
+        self.assertEqual(
+            list(AuthorStats.objects.values_list(
+                'posts_count', 'followers_count', 'following_count'
+            )),
+            [(0, 0, 0)] * 2,
+        )
+
+    def test_repair_counters_fixes_drift(self):
+        post = Post.objects.create(text = 'hello', author = self.myuser, group = self.group1)
+        Comment.objects.create(post = post, author = self.myuser, text = 'koment')
+        Post.objects.filter(pk = post.pk).update(comments_count = 7)
+        AuthorStats.objects.filter(user = self.myuser).update(posts_count = 3)
+
+        out = StringIO()
+        call_command('repair_counters', stdout = out)
+        self.assertIn('2 counter(s) repaired', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(AuthorStats.objects.get(user = self.myuser).posts_count, 1)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.group1 = Group.objects.create(title = 'g1', slug = 'g1', description = 'g1')
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [post.text for post in response.context['page']]
+
+    def test_search_ranks_and_filters(self):
+        Post.objects.create(text = 'котики и собаки', author = self.myuser)
+        Post.objects.create(text = 'котики котики котики', author = self.author, group = self.group1)
+        Post.objects.create(text = 'только собаки', author = self.author)
+
+        self.assertEqual(
+            self.search(q = 'котики'),
+            ['котики котики котики', 'котики и собаки']
+        )
+        self.assertEqual(self.search(q = 'котики собаки'), ['котики и собаки'])
+        self.assertEqual(self.search(q = 'собаки', author = 'avtor'), ['только собаки'])
+        self.assertEqual(self.search(q = 'котики', group = 'g1'), ['котики котики котики'])
+        self.assertEqual(self.search(q = '"AND (*'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(text = 'старый текст', author = self.myuser)
+        post.text = 'новый текст'
+        post.save()
+        self.assertEqual(self.search(q = 'старый'), [])
+        self.assertEqual(self.search(q = 'новый'), ['новый текст'])
+        post.delete()
+        self.assertEqual(self.search(q = 'новый'), [])
+
+    def test_search_pages_by_cursor(self):
+        for i in range(15):
+            Post.objects.create(text = f'слово {i}', author = self.myuser)
+        response = self.client.get(reverse('search'), {'q': 'слово'})
+        page = response.context['page']
+        self.assertEqual(len(page), 10)
+        self.assertContains(response, f'?q=%D1%81%D0%BB%D0%BE%D0%B2%D0%BE&amp;cursor={page.next_cursor}')
+        response = self.client.get(
+            reverse('search'), {'q': 'слово', 'cursor': page.next_cursor}
+        )
+        self.assertEqual(len(response.context['page']), 5)
+        seen = {post.pk for post in page} | {post.pk for post in response.context['page']}
+        self.assertEqual(len(seen), 15)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        group = Group.objects.create(title = 'g1', slug = 'g1', description = 'g1')
+        self.post = Post.objects.create(
+            text = 'exported kotik', author = self.author, group = group
+        )
+        Comment.objects.create(post = self.post, author = self.myuser, text = 'koment')
+        Follow.objects.create(user = self.myuser, author = self.author)
+        self.dump = os.path.join(tempfile.mkdtemp(), 'dump.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.dump))
+
+    def test_round_trip_into_empty_database(self):
+        call_command('export_yatube', self.dump, stdout = StringIO())
+        pub_date = self.post.pub_date
+        User.objects.all().delete()
+        Group.objects.all().delete()
+
+        call_command('import_yatube', self.dump, '--keep-dates', stdout = StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.text, 'exported kotik')
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.author.username, 'avtor')
+        self.assertEqual(post.group.slug, 'g1')
+        self.assertEqual(post.comments.get().author.username, 'biba')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.group.posts_count, 1)
+        self.assertEqual(post.author.stats.followers_count, 1)
+        self.assertTrue(Follow.objects.filter(
+            user__username = 'biba', author__username = 'avtor'
+        ).exists())
+        self.assertTrue(FeedItem.objects.filter(post = post).exists())
+        response = self.client.get(reverse('search'), {'q': 'kotik'})
+        self.assertContains(response, 'exported kotik')
+
+    def test_import_reuses_existing_users_and_groups(self):
+        call_command('export_yatube', self.dump, stdout = StringIO())
+        call_command('import_yatube', self.dump, stdout = StringIO())
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(Post.objects.filter(author = self.author).count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(AuthorStats.objects.get(user = self.author).posts_count, 2)
+
+
+class SyndicationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.group = Group.objects.create(title = 'g1', slug = 'g1', description = 'g1')
+        self.post = Post.objects.create(
+            text = 'first kotik', author = self.author, group = self.group
+        )
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_feeds_stream_every_format(self):
+        for url in (
+            reverse('index_feed', args = ['atom']),
+            reverse('group_feed', args = ['g1', 'rss']),
+            reverse('profile_feed', args = ['avtor', 'json']),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            self.assertIn('first kotik', self.read(response))
+        data = json.loads(self.read(self.client.get(
+            reverse('profile_feed', args = ['avtor', 'json'])
+        )))
+        self.assertEqual(data['items'][0]['tags'], ['g1'])
+
+    def test_unknown_feed_is_404(self):
+        self.assertEqual(self.client.get('/feed/xml/').status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('group_feed', args = ['nope', 'atom'])).status_code,
+            404
+        )
+
+    def test_conditional_get_until_new_post(self):
+        url = reverse('index_feed', args = ['atom'])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 304)
+
+        Post.objects.create(text = 'second kotik', author = self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('second kotik', self.read(response))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.group = Group.objects.create(title = 'g1', slug = 'g1', description = 'g1')
+        self.post = Post.objects.create(
+            text = 'kotik', author = self.author, group = self.group
+        )
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        for url in (
+            reverse('group', args = ['g1']),
+            reverse('profile', args = ['avtor']),
+            reverse('post', args = ['avtor', self.post.id]),
+        ):
+            response = self.client.get(url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH = response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_writes_and_login_change_the_etag(self):
+        url = reverse('post', args = ['avtor', self.post.id])
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post = self.post, author = self.author, text = 'koment')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertContains(response, 'koment')
+
+        etag = response['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_follows_the_cached_copy(self):
+        url = reverse('profile', args = ['avtor'])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(Client().get(url)['ETag'], etag)
+
+        other = Client()
+        other.force_login(self.author)
+        response = other.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.group = Group.objects.create(title = 'g1', slug = 'g1', description = 'g1')
+        self.posts = [
+            Post.objects.create(
+                text = 'post %s' % i, author = self.author, group = self.group
+            )
+            for i in range(3)
+        ]
+        Comment.objects.create(post = self.posts[0], author = self.myuser, text = 'koment')
+
+    def test_post_list_pages_by_cursor_with_embedded_author(self):
+        data = self.client.get(reverse('api_posts'), {'limit': 2}).json()
+        self.assertEqual([post['text'] for post in data['results']], ['post 2', 'post 1'])
+        self.assertEqual(data['results'][0]['author']['username'], 'avtor')
+        self.assertEqual(data['results'][0]['group'], {'slug': 'g1', 'title': 'g1'})
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([post['text'] for post in data['results']], ['post 0'])
+        self.assertIsNone(data['next'])
+
+    def test_sparse_fieldsets(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(reverse('api_posts'), {'fields': 'id,text'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        response = self.client.get(reverse('api_posts'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail_endpoints(self):
+        post = self.posts[0]
+        data = self.client.get(reverse('api_post', args = [post.id])).json()
+        self.assertEqual(data['comments_count'], 1)
+        comments = self.client.get(reverse('api_comments', args = [post.id])).json()
+        self.assertEqual(comments['results'][0]['author']['username'], 'biba')
+        profile = self.client.get(reverse('api_profile', args = ['avtor'])).json()
+        self.assertEqual(profile['posts_count'], 3)
+        group = self.client.get(reverse('api_group', args = ['g1'])).json()
+        self.assertEqual(group['posts_count'], 3)
+        response = self.client.get(reverse('api_post', args = [999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+    def test_etag_until_post_changes(self):
+        url = reverse('api_post', args = [self.posts[0].id])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post = self.posts[0], author = self.myuser, text = 'again')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH = etag).status_code, 200)
+
+    def test_etag_follows_embedded_author_and_group(self):
+        post = self.posts[0]
+        for url in (
+            reverse('api_post', args = [post.id]),
+            reverse('api_comments', args = [post.id]),
+        ):
+            for scope in (
+                generations.author_scope('avtor'), generations.group_scope('g1')
+            ):
+                etag = self.client.get(url)['ETag']
+                generations.bump(scope)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed_needs_login(self):
+        self.assertEqual(self.client.get(reverse('api_feed')).status_code, 401)
+        Follow.objects.create(user = self.myuser, author = self.author)
+        self.client.force_login(self.myuser)
+        data = self.client.get(reverse('api_feed'), {'fields': 'text'}).json()
+        self.assertEqual(
+            [post['text'] for post in data['results']], ['post 2', 'post 1', 'post 0']
+        )
+
+
+class BenchmarkTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(benchmark.missing_scenarios(), [])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+    def test_runs_against_synthetic_dataset(self):
+        benchmark.load(benchmark.dataset(
+            users = 10, groups = 2, posts = 30, follows = 3, comments = 1
+        ))
+        self.assertEqual(Post.objects.count(), 30)
+        bench = benchmark.Benchmark()
+        for name in benchmark.SCENARIOS:
+            result = bench.run(name, requests = 2)
+            self.assertEqual(result['requests'], 2)
+            self.assertTrue(
+                all(status < 400 for status in map(int, result['statuses'])), name
+            )
+
+    def test_client_failing_to_start_stops_the_concurrent_run(self):
+        benchmark.load(benchmark.dataset(
+            users = 3, groups = 1, posts = 3, follows = 1, comments = 1
+        ))
+        bench = benchmark.Benchmark()
+        locked = OperationalError('database is locked')
+        with mock.patch.object(benchmark.Benchmark, '__init__', side_effect = locked):
+            with self.assertRaisesRegex(RuntimeError, r'Client \d of 2 .*locked'):
+                bench.run_concurrent(['index'], threads = 2, requests = 1)
+
+
+@override_settings(DATABASE_REPLICAS = ['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        Post.objects.create(text = 'old post', author = self.myuser)
+        self.client.force_login(self.myuser)
+        self.anonymous = Client()
+        # The replica is a file copy taken now: later writes miss it.
+        self.tmpdir = tempfile.mkdtemp()
+        name = os.path.join(self.tmpdir, 'replica.sqlite3')
+        connection.ensure_connection()
+        replica = sqlite3.connect(name)
+        connection.connection.backup(replica)
+        replica.close()
+        connections.databases['replica'] = dict(connection.settings_dict, NAME = name)
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+        shutil.rmtree(self.tmpdir)
+
+    def test_reads_go_to_replica(self):
+        Post.objects.create(text = 'unreplicated', author = self.myuser)
+        response = self.anonymous.get(reverse('index'))
+        self.assertContains(response, 'old post')
+        self.assertNotContains(response, 'unreplicated')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writer_is_pinned_to_primary(self):
+        response = self.client.post(reverse('new_post'), {'text': 'my new post'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse('index')), 'my new post')
+
+    def test_follow_on_get_pins_to_primary(self):
+        author = User.objects.create(username = 'avtor', password = 'avtor')
+        response = self.client.get(reverse('profile_follow', args = ['avtor']))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(Follow.objects.filter(user = self.myuser, author = author).exists())
+
+    def test_bookkeeping_writes_do_not_pin(self):
+        User.objects.create_user(username = 'avtor', password = 'secret-pass-1')
+        response = self.anonymous.post(
+            reverse('login'), {'username': 'avtor', 'password': 'secret-pass-1'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        # A profile read creates the missing counters row on the primary.
+        for alias in ('default', 'replica'):
+            AuthorStats.objects.using(alias).filter(user = self.myuser).delete()
+        response = self.anonymous.get(reverse('profile', args = ['biba']))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(AuthorStats.objects.filter(user = self.myuser).exists())
+
+    def test_expired_pin_reads_replica(self):
+        Post.objects.create(text = 'unreplicated', author = self.myuser)
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.assertNotContains(self.client.get(reverse('index')), 'unreplicated')
+
+
+class SQLiteBackendTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        settings_dict = dict(
+            connection.settings_dict,
+            ENGINE = 'yatube.sqlite_backend',
+            NAME = os.path.join(self.tmpdir, 'db.sqlite3'),
+            PRAGMAS = {'journal_mode': 'WAL', 'busy_timeout': 5000},
+            TRANSACTION_MODE = 'IMMEDIATE',
+        )
+        self.wrapper = sqlite_backend.DatabaseWrapper(settings_dict, alias = 'pragmas')
+
+    def tearDown(self):
+        self.wrapper.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_pragmas_applied_to_new_connection(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_transaction_takes_write_lock_at_begin(self):
+        self.wrapper.set_autocommit(True)
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.wrapper.settings_dict['NAME'], timeout = 0)
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        other.close()
+        self.wrapper.rollback()
+
+    def test_optimize_command(self):
+        out = StringIO()
+        call_command('optimize_database', stdout = out)
+        self.assertIn('PRAGMA optimize done', out.getvalue())
+
+
+class ThumbnailWorkerPoolTests(TransactionTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        # Spawned workers cannot open the in-memory test database: they get
+        # a file copy of it, taken after migrations, for the thumbnail store.
+        name = os.path.join(self.media, 'db.sqlite3')
+        connection.ensure_connection()
+        worker_db = sqlite3.connect(name)
+        connection.connection.backup(worker_db)
+        worker_db.close()
+        # Workers read and write the thumbnail store through the cache too,
+        # so it has to be one they share, as on the site.
+        self.settings_override = override_settings(
+            MEDIA_ROOT = self.media,
+            CACHES = {'default': {
+                'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+                'LOCATION': os.path.join(self.media, 'cache.sqlite3'),
+            }},
+        )
+        self.settings_override.enable()
+        self.worker_settings = dict(
+            thumbnails.worker_settings(),
+            DATABASES = {'default': dict(connection.settings_dict, NAME = name)},
+        )
+        author = User.objects.create(username = 'biba', password = 'boba')
+        self.post = Post.objects.create(text = 'with image', author = author)
+        image_obj = BytesIO()
+        Image.new("RGB", size=(100, 100), color=(255, 0, 0)).save(image_obj, 'png')
+        # Stored without save(), so no thumbnails are scheduled for it.
+        self.image = default_storage.save('posts/image.png', ContentFile(image_obj.getvalue()))
+        Post.objects.filter(pk = self.post.pk).update(image = self.image)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media)
+
+    def test_spawned_workers_render_into_the_same_store(self):
+        scope = generations.post_scope(self.post.pk)
+        before = generations.get_generations(scope)
+        out = StringIO()
+        with mock.patch.object(
+            thumbnails, 'worker_settings', return_value = self.worker_settings
+        ):
+            call_command('rebuild_thumbnails', '--workers', '2', stdout = out)
+        self.assertIn('1 thumbnails rendered', out.getvalue())
+        self.assertEqual(thumbnails.missing_sizes(self.image), [])
+        self.assertNotEqual(generations.get_generations(scope), before)
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmpdir, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        self.cache.set('a', {'x': 1})
+        self.cache.set_many({'b': 2, 'c': 'three'})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertEqual(self.cache.get_many(['b', 'c', 'd']), {'b': 2, 'c': 'three'})
+        self.assertFalse(self.cache.add('b', 5))
+        self.assertTrue(self.cache.add('d', 5))
+        self.assertEqual(self.cache.incr('d', 10), 15)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('gone', 1, timeout = -1)
+        self.assertFalse(self.cache.has_key('gone'))
+
+    def test_incr_keeps_the_size_total(self):
+        self.cache.set('n', 2 ** 63 - 2)
+        self.cache.set('f', 1.5)
+        self.cache.incr('n', 5)
+        self.cache.incr('f')
+        stored = self.cache._connection().execute('SELECT SUM(size) FROM cache').fetchone()[0]
+        self.assertGreater(stored, 16)
+        self.assertEqual(self.cache.stats()['size'], stored)
+
+    def test_entries_are_shared_between_instances(self):
+        other = self.make_cache()
+        self.cache.set('shared', 'value')
+        self.assertEqual(other.get('shared'), 'value')
+        other.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter'), 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        small = self.make_cache(MAX_SIZE = 3500, TOUCH_INTERVAL = 0)
+        small.set('old', b'x' * 900)
+        small.set('cold', b'x' * 900)
+        small.set('new', b'x' * 900)
+        small.get('old')
+        small.set('overflow', b'x' * 900)
+        self.assertIsNone(small.get('cold'))
+        self.assertIsNotNone(small.get('old'))
+        stats = small.stats()
+        self.assertLessEqual(stats['size'], 3500)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username = 'avtor', password = 'avtor')
+        Post.objects.create(text = 'kotik', author = author)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE = 1)
+    def test_sampled_request_reports_server_timing_and_log(self):
+        with self.assertLogs('yatube.requests', 'INFO') as logs:
+            response = self.client.get(reverse('profile', args = ['avtor']))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertIn('misses"', timing)
+        self.assertIn('path=/avtor/ status=200', logs.output[0])
+        self.assertIn('db_queries=', logs.output[0])
+
+    def test_log_lines_are_not_dropped(self):
+        logger = logging.getLogger('yatube.requests')
+        self.assertTrue(logger.isEnabledFor(logging.INFO))
+        self.assertTrue(logger.handlers)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE = 0)
+    def test_disabled_adds_nothing(self):
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username = 'avtor', password = 'avtor')
+        self.post = Post.objects.create(text = 'kotik', author = self.author)
+        self.client.force_login(self.author)
+
+    @override_settings(RATE_LIMITS = {'add_comment': {'rate': '2/m', 'methods': ['POST']}})
+    def test_over_limit_gets_429_with_retry_after(self):
+        url = reverse('add_comment', args = ['avtor', self.post.id])
+        statuses = [
+            self.client.post(url, {'text': 'hi'}).status_code for _ in range(3)
+        ]
+        self.assertEqual(statuses, [302, 302, 429])
+        response = self.client.post(url, {'text': 'hi'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+        self.assertEqual(Comment.objects.count(), 2)
+
+        other = Client()
+        other.force_login(User.objects.create(username = 'biba', password = 'boba'))
+        self.assertEqual(other.post(url, {'text': 'hi'}).status_code, 302)
+
+    @override_settings(RATE_LIMITS = {'signup': {'rate': '1/m', 'methods': ['POST']}})
+    def test_anonymous_clients_are_limited_by_ip(self):
+        client = Client()
+        url = reverse('signup')
+        self.assertEqual(client.post(url, REMOTE_ADDR = '10.0.0.1').status_code, 200)
+        self.assertEqual(client.post(url, REMOTE_ADDR = '10.0.0.1').status_code, 429)
+        self.assertEqual(client.post(url, REMOTE_ADDR = '10.0.0.2').status_code, 200)
+        self.assertEqual(client.get(url, REMOTE_ADDR = '10.0.0.1').status_code, 200)
+
+    def test_tokens_refill_over_the_period(self):
+        rule = ratelimit.Rule('2/m')
+        self.assertEqual(ratelimit.take('bucket', rule, now = 1000), 0)
+        self.assertEqual(ratelimit.take('bucket', rule, now = 1000), 0)
+        self.assertEqual(ratelimit.take('bucket', rule, now = 1000), 30)
+        self.assertEqual(ratelimit.take('bucket', rule, now = 1010), 20)
+        self.assertEqual(ratelimit.take('bucket', rule, now = 1030), 0)
+        self.assertEqual(ratelimit.take('bucket', rule, now = 1030), 30)
+        # Idle for longer than the period: the whole burst is back.
+        self.assertEqual(ratelimit.take('bucket', rule, now = 2000), 0)
+        self.assertEqual(ratelimit.take('bucket', rule, now = 2000), 0)
+
+    def test_decorator_and_no_queries_on_the_hot_path(self):
+        @ratelimit.ratelimit('1/h')
+        def view(request):
+            return HttpResponse('ok')
+
+        request = RequestFactory().post('/', REMOTE_ADDR = '10.0.0.3')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            self.assertEqual(view(request).status_code, 200)
+        response = view(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
+
+    def test_bad_rate_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ratelimit.Rule('10/fortnight')
+
+
+class ThumbnailPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT = self.media)
+        self.settings_override.enable()
+        self.myuser = User.objects.create(username = 'biba', password = 'boba')
+        self.client.force_login(self.myuser)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media)
+
+    def upload(self):
+        image_obj = BytesIO()
+        Image.new("RGB", size=(100, 100), color=(255, 0, 0)).save(image_obj, 'png')
+        img = SimpleUploadedFile('image.png', image_obj.getvalue(), 'image/png')
+        self.client.post(reverse('new_post'), {'text': 'with image', 'image': img})
+        return Post.objects.get()
+
+    def test_request_shows_placeholder_until_worker_renders(self):
+        post = self.upload()
+        self.assertTrue(post.image)
+        self.assertEqual(thumbnails.missing_sizes(post.image), ['card'])
+
+        url = reverse('post', args = [self.myuser.username, post.id])
+        self.assertContains(self.client.get(url), 'data:image/svg+xml')
+
+        thumbnails.generate(post.pk)
+        self.assertEqual(thumbnails.missing_sizes(post.image), [])
+        response = self.client.get(url)
+        self.assertNotContains(response, 'data:image/svg+xml')
+        self.assertContains(response, thumbnails.cached_thumbnail(post.image, 'card').url)
+
+    def test_rebuild_command_renders_missing_and_resumes(self):
+        post = self.upload()
+        state_file = os.path.join(self.media, 'state')
+        out = StringIO()
+        call_command(
+            'rebuild_thumbnails', '--workers', '0', '--state-file', state_file,
+            stdout = out,
+        )
+        self.assertEqual(thumbnails.missing_sizes(post.image), [])
+        self.assertIn('1 thumbnails rendered', out.getvalue())
+        with open(state_file) as state:
+            self.assertEqual(state.read(), str(post.pk))
+
+        out = StringIO()
+        call_command('rebuild_thumbnails', '--workers', '0', stdout = out)
+        self.assertIn('1 already cached', out.getvalue())
@@ -0,0 +1,127 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def geometries():
+    """Every (geometry, options) the templates render post images at."""
+    return settings.POST_THUMBNAILS
+
+
+class PipelineBackend(ThumbnailBackend):
+    def cached_thumbnail(self, file_, geometry_string, **options):
+        """
+        Return the thumbnail if sorl already knows it, `None` otherwise.
+        Unlike `get_thumbnail` this never opens or resizes the source image.
+        """
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = PipelineBackend()
+
+
+def cached_thumbnail(image, size):
+    geometry, options = geometries()[size]
+    return backend.cached_thumbnail(image, geometry, **options)
+
+
+def missing_sizes(image):
+    return [
+        size for size in geometries() if cached_thumbnail(image, size) is None
+    ]
+
+
+def render(image):
+    """Render every missing size of `image`; returns how many were made."""
+    made = 0
+    for size in missing_sizes(image):
+        geometry, options = geometries()[size]
+        backend.get_thumbnail(image, geometry, **options)
+        made += 1
+    return made
+
+
+# Settings a worker process of `rebuild_thumbnails` takes from the command
+# rather than from the settings module, so it renders into the same storage
+# and thumbnail store.
+WORKER_SETTINGS = ('DATABASES', 'CACHES', 'MEDIA_ROOT')
+
+
+def worker_settings():
+    return {name: getattr(settings, name) for name in WORKER_SETTINGS}
+
+
+def setup_worker(overrides):
+    """Initializer of a spawned worker process, run before Django is set up."""
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+
+
+def generate(post_id):
+    from .models import Post
+    from .signals import invalidate_post
+
+    try:
+        post = Post.objects.filter(pk=post_id).only(
+            'image', 'author', 'group'
+        ).first()
+        if post is not None and post.image and render(post.image):
+            # Cached pages still show the placeholder.
+            invalidate_post(post.pk, post.author_id, [post.group_id])
+    except Exception:
+        logger.exception('Could not make thumbnails for post %s', post_id)
+
+
+def generate_in_thread(post_id):
+    """`generate` on a pool thread, which owns its database connection."""
+    close_old_connections()
+    try:
+        generate(post_id)
+    finally:
+        close_old_connections()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def schedule(post):
+    """
+    Queue thumbnail generation for `post` once its transaction commits, so
+    the request thread never decodes the image. With THUMBNAIL_WORKERS = 0
+    the thumbnails are rendered right after the commit instead.
+    """
+    post_id = post.pk
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: generate(post_id))
+        return
+    transaction.on_commit(lambda: executor().submit(generate_in_thread, post_id))
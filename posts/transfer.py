@@ -0,0 +1,249 @@
+"""
+Streaming JSONL export and import of users, groups, posts, comments and
+follows. Every line is one record:
+
+    {"model": "posts.post", "pk": 12, "fields": {"text": "...", "author": 3, ...}}
+
+Foreign keys hold the primary keys of the exporting database; the importer
+gives every row a fresh key and rewrites the references, so a dump can be
+loaded into a database that already has data.
+"""
+import datetime
+import json
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from . import authors, counters, feed, generations, search
+from .models import Comment, Follow, Group, Post, User
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+
+# (model, exported fields, foreign key fields -> target model), in the order
+# records are written, so every reference points at an already loaded row.
+SPECS = [
+    (User, [
+        'username', 'first_name', 'last_name', 'email', 'password',
+        'is_staff', 'is_active', 'is_superuser', 'last_login', 'date_joined',
+    ], {}),
+    (Group, ['title', 'slug', 'description'], {}),
+    (Post, ['text', 'pub_date', 'author', 'group', 'image'], {
+        'author': User, 'group': Group,
+    }),
+    (Comment, ['post', 'author', 'parent', 'text', 'created'], {
+        'post': Post, 'author': User, 'parent': Comment,
+    }),
+    (Follow, ['user', 'author'], {'user': User, 'author': User}),
+]
+
+# Rows matched to an existing one by this field instead of being duplicated.
+NATURAL_KEYS = {User: 'username', Group: 'slug'}
+
+DATE_FIELDS = {'pub_date', 'created', 'last_login', 'date_joined'}
+
+
+def label(model):
+    return model._meta.label_lower
+
+
+MODELS = {label(model): model for model, _, _ in SPECS}
+
+
+def encode(value):
+    # Full isoformat: DjangoJSONEncoder drops the microseconds, which would
+    # reorder posts on the (pub_date, id) keyset.
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def export_lines(model):
+    """JSON lines for every row of `model`, read with a server-side iterator."""
+    fields = next(fields for spec, fields, _ in SPECS if spec is model)
+    rows = model.objects.order_by('pk').values_list('pk', *fields)
+    for pk, *values in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield json.dumps(
+            {'model': label(model), 'pk': pk, 'fields': dict(zip(fields, values))},
+            default=encode, ensure_ascii=False,
+        )
+
+
+@contextmanager
+def auto_now_add_disabled():
+    """Let bulk_create keep the exported pub_date and created stamps."""
+    fields = [Post._meta.get_field('pub_date'), Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Importer:
+    """
+    Loads JSONL records in batches with `bulk_create`. Primary keys are
+    allocated here rather than read back, since SQLite does not return them
+    from a bulk insert; `pk_maps` remembers old -> new key per model.
+    """
+
+    def __init__(self, keep_dates=False, batch_size=IMPORT_BATCH_SIZE):
+        self.keep_dates = keep_dates
+        self.batch_size = batch_size
+        self.pk_maps = {model: {} for model in MODELS.values()}
+        self.next_pk = {}
+        self.usernames = {}
+        self.slugs = {}
+        self.follows = set()
+        self.authors_with_posts = set()
+
+    def load(self, lines):
+        """Import every line; yields `(model, imported, skipped)` per batch."""
+        if self.keep_dates:
+            with auto_now_add_disabled():
+                yield from self._load(lines)
+        else:
+            yield from self._load(lines)
+
+    def _load(self, lines):
+        model = None
+        batch = []
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            try:
+                record_model = MODELS[record['model']]
+            except KeyError:
+                raise ValueError(f'Line {number}: unknown model {record["model"]!r}')
+            if batch and (record_model is not model or len(batch) >= self.batch_size):
+                yield (model, *self.save(model, batch))
+                batch = []
+            model = record_model
+            batch.append(record)
+        if batch:
+            yield (model, *self.save(model, batch))
+
+    def allocate_pk(self, model):
+        if model not in self.next_pk:
+            self.next_pk[model] = (
+                model.objects.aggregate(last=Max('pk'))['last'] or 0
+            ) + 1
+        pk = self.next_pk[model]
+        self.next_pk[model] += 1
+        return pk
+
+    def values(self, record, fields, foreign_keys):
+        """Model field values of `record`, `None` if a reference is dangling."""
+        values = {}
+        for name in fields:
+            value = record['fields'].get(name)
+            if name in foreign_keys:
+                if value is not None:
+                    value = self.pk_maps[foreign_keys[name]].get(value)
+                    if value is None:
+                        return None
+                name += '_id'
+            elif name in DATE_FIELDS and value is not None:
+                value = parse_datetime(value)
+            values[name] = value
+        return values
+
+    def save(self, model, records):
+        fields, foreign_keys = next(
+            (fields, fks) for spec, fields, fks in SPECS if spec is model
+        )
+        natural = NATURAL_KEYS.get(model)
+        existing = self.existing(model, records)
+        objects = []
+        skipped = 0
+        for record in records:
+            values = self.values(record, fields, foreign_keys)
+            if values is None:
+                skipped += 1
+                continue
+            if natural and values[natural] in existing:
+                pk = existing[values[natural]]
+                self.pk_maps[model][record['pk']] = pk
+                self.remember(model, pk, values)
+                skipped += 1
+                continue
+            if model is Follow:
+                pair = (values['user_id'], values['author_id'])
+                if pair in existing:
+                    skipped += 1
+                    continue
+                existing.add(pair)
+            pk = self.allocate_pk(model)
+            if natural:
+                existing[values[natural]] = pk
+            self.pk_maps[model][record['pk']] = pk
+            self.remember(model, pk, values)
+            objects.append(model(pk=pk, **values))
+        model.objects.bulk_create(objects)
+        return len(objects), skipped
+
+    def existing(self, model, records):
+        """Rows of this batch that are already in the database."""
+        natural = NATURAL_KEYS.get(model)
+        if natural:
+            keys = [record['fields'][natural] for record in records]
+            return dict(
+                model.objects.filter(**{f'{natural}__in': keys})
+                .values_list(natural, 'pk')
+            )
+        if model is Follow:
+            user_ids = {
+                self.pk_maps[User].get(record['fields']['user'])
+                for record in records
+            }
+            return set(
+                Follow.objects.filter(user_id__in=user_ids)
+                .values_list('user_id', 'author_id')
+            )
+        return {}
+
+    def remember(self, model, pk, values):
+        if model is User:
+            self.usernames[pk] = values['username']
+        elif model is Group:
+            self.slugs[pk] = values['slug']
+        elif model is Post:
+            self.authors_with_posts.add(values['author_id'])
+        elif model is Follow:
+            self.follows.add((values['user_id'], values['author_id']))
+
+    def finish(self):
+        """
+        Bring the derived data up to date: bulk_create sends no signals, so
+        counters, the search index, feeds and cached pages and usernames are
+        rebuilt here.
+        """
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(
+                no_style(), list(MODELS.values())
+            ):
+                cursor.execute(statement)
+        repaired = sum(1 for _ in counters.repair())
+        search.rebuild_index()
+        cache.delete(feed.CELEBRITIES_CACHE_KEY)
+        authors.forget(*self.usernames.values())
+        follows = self.follows | set(
+            Follow.objects.filter(author_id__in=self.authors_with_posts)
+            .values_list('user_id', 'author_id')
+        )
+        for user_id, author_id in follows:
+            feed.backfill(user_id, author_id)
+        generations.bump(
+            generations.GLOBAL,
+            *[generations.author_scope(name) for name in self.usernames.values()],
+            *[generations.group_scope(slug) for slug in self.slugs.values()],
+        )
+        return repaired
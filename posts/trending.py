@@ -0,0 +1,143 @@
+"""
+Trending posts, ranked by engagement that decays with age.
+
+Comments and follows add to an hourly `EngagementBucket` of the post with
+one UPDATE, so nothing is aggregated on a request. `compact()` runs from
+the `compact_trending` command every few minutes: it drops buckets older
+than TRENDING_WINDOW_HOURS, weighs the rest by their age (the weight
+halves every TRENDING_HALF_LIFE_HOURS) and rewrites the `TrendingPost`
+top list of the site and of every group, which pages read by rank.
+"""
+import heapq
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import generations
+from .models import EngagementBucket, Group, Post, TrendingPost
+
+BUCKET = timedelta(hours=1)
+
+COMMENT_WEIGHT = 2
+FOLLOW_WEIGHT = 1
+
+
+def window():
+    return timedelta(hours=getattr(settings, 'TRENDING_WINDOW_HOURS', 48))
+
+
+def half_life():
+    return timedelta(hours=getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 6))
+
+
+def top_size():
+    return getattr(settings, 'TRENDING_SIZE', 50)
+
+
+def bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record(post_id, weight, now=None):
+    """Add `weight` to the post's bucket of the current hour."""
+    start = bucket_start(now or timezone.now())
+    bucket = EngagementBucket.objects.filter(post_id=post_id, start=start)
+    if bucket.update(score=F('score') + weight):
+        return
+    # First event of the hour. A concurrent first insert wins the conflict
+    # and the UPDATE then adds to its row.
+    EngagementBucket.objects.bulk_create(
+        [EngagementBucket(post_id=post_id, start=start)], ignore_conflicts=True
+    )
+    bucket.update(score=F('score') + weight)
+
+
+def record_follow(author_id, now=None):
+    """A follow counts towards the author's newest post of the window."""
+    now = now or timezone.now()
+    post_id = (
+        Post.objects.filter(author_id=author_id, pub_date__gte=now - window())
+        .order_by('-pub_date', '-id')
+        .values_list('pk', flat=True)
+        .first()
+    )
+    if post_id is not None:
+        record(post_id, FOLLOW_WEIGHT, now)
+
+
+def decayed(score, start, now):
+    age = (now - start) / half_life()
+    return score * math.pow(0.5, max(age, 0))
+
+
+def compact(now=None):
+    """
+    Drop expired buckets and rewrite every ranking, bumping the scopes of
+    the rankings whose order changed. Returns the number of posts that
+    were ranked.
+    """
+    now = now or timezone.now()
+    EngagementBucket.objects.filter(start__lt=bucket_start(now - window())).delete()
+
+    scores = defaultdict(float)
+    groups = {}
+    buckets = EngagementBucket.objects.values_list(
+        'post_id', 'post__group_id', 'start', 'score'
+    )
+    for post_id, group_id, start, score in buckets.iterator():
+        scores[post_id] += decayed(score, start, now)
+        groups[post_id] = group_id
+
+    by_group = defaultdict(list)
+    for post_id, score in scores.items():
+        by_group[None].append((score, post_id))
+        if groups[post_id] is not None:
+            by_group[groups[post_id]].append((score, post_id))
+
+    size = top_size()
+    rankings = {
+        group_id: heapq.nlargest(size, candidates)
+        for group_id, candidates in by_group.items()
+    }
+    rows = [
+        TrendingPost(group_id=group_id, rank=rank, post_id=post_id, score=score)
+        for group_id, ranking in rankings.items()
+        for rank, (score, post_id) in enumerate(ranking, 1)
+    ]
+    with transaction.atomic():
+        previous = defaultdict(list)
+        ranked_rows = TrendingPost.objects.order_by('group_id', 'rank')
+        for group_id, post_id in ranked_rows.values_list('group_id', 'post_id'):
+            previous[group_id].append(post_id)
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(rows, batch_size=1000)
+
+    # Pages show the order, not the scores: only a new order is a change.
+    changed = {
+        group_id for group_id in set(previous) | set(rankings)
+        if previous.get(group_id, []) != [
+            post_id for score, post_id in rankings.get(group_id, [])
+        ]
+    }
+    slugs = Group.objects.filter(pk__in=changed - {None}).values_list('slug', flat=True)
+    scopes = [generations.group_scope(slug) for slug in slugs]
+    if None in changed:
+        scopes.append(generations.TRENDING)
+    generations.bump(*scopes)
+    return len(scores)
+
+
+def ranked(group=None, limit=None):
+    """The ranked posts of the site or of `group`, read through the rank index."""
+    rows = (
+        TrendingPost.objects.filter(group=group)
+        .order_by('rank')
+        .select_related('post__author', 'post__group')
+        .defer('post__text')
+    )
+    return [row.post for row in rows[:limit]]
@@ -4,11 +4,21 @@ from . import views
  
 urlpatterns = [
     path("", views.index, name="index"),
+    path("feed/<str:format>/", views.index_feed, name="index_feed"),
     path("group/<slug:slug>/", views.group_posts, name='group'),
+    path("group/<slug:slug>/feed/<str:format>/", views.group_feed, name='group_feed'),
     path("follow/", views.follow_index, name="follow_index"),
+    path("trending/", views.trending, name="trending"),
     path("new/", views.new_post, name="new_post"),
+    path("search/", views.search, name="search"),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path('<str:username>/feed/<str:format>/', views.profile_feed, name='profile_feed'),
     path(
         '<str:username>/<int:post_id>/edit/', 
         views.post_edit, 
@@ -17,4 +27,14 @@ urlpatterns = [
     path("<username>/<int:post_id>/comment", views.add_comment, name='add_comment'),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"), 
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
+    path(
+        "<str:username>/followers/",
+        views.profile_followers,
+        name="profile_followers"
+    ),
+    path(
+        "<str:username>/following/",
+        views.profile_following,
+        name="profile_following"
+    ),
 ]
\ No newline at end of file
@@ -1,17 +1,50 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.urls import reverse
+from django.views.decorators.http import condition
+from django.utils.http import urlencode
+from yatube.db_router import use_primary
 from .models import Post, Group, User, Comment, Follow
+from .models import COMMENT_MAX_DEPTH
+from .authors import get_author_or_404
+from .post_cache import get_post_or_404
 from .forms import PostForm, CommentForm
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from .paginator import CursorPaginator
+from .feed import FeedPaginator
+from .counters import stats_for
+from .search import search_paginator
+from .syndication import feed_etag, feed_response, feed_updated
+from .generations import (
+    GLOBAL, TRENDING, author_scope, cache_page_by_generation, group_scope, post_scope
+)
+from . import trending as trending_posts
 
-@cache_page(20)
-def index(request):
-    post_list = Post.objects.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 50
+FOLLOWS_PER_PAGE = 50
+GROUP_TRENDING_SIZE = 5
+
+
+def paginate(request, post_list):
+    paginator = CursorPaginator(post_list, POSTS_PER_PAGE)
+    return paginator, paginator.get_page(request.GET.get('cursor'))
+
+
+def paginate_comments(request, comments):
+    """Comments in thread order, a page at a time by cursor on the path."""
+    paginator = CursorPaginator(comments, COMMENTS_PER_PAGE, ordering=('path',))
+    return paginator.get_page(request.GET.get('cursor'))
 
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+
+def comment_id(value):
+    return int(value) if value and value.isdigit() else None
+
+
+@cache_page_by_generation(lambda: [GLOBAL])
+def index(request):
+    post_list = Post.objects.for_listing()
+    paginator, page = paginate(request, post_list)
     
     return render(request,
         "index.html",
@@ -21,15 +54,16 @@ def index(request):
         }
     )
 
+# Post writes bump GLOBAL, so an edited or deleted post leaves the page too.
+@cache_page_by_generation(lambda: [GLOBAL, TRENDING])
+def trending(request):
+    return render(request, "trending.html", {"posts": trending_posts.ranked()})
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.order_by('-pub_date').filter(
-        author__following__user=request.user
-    )
-    paginator = Paginator(post_list, 10)
-
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator = FeedPaginator(request.user, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('cursor'))
     
     return render(
         request, 
@@ -40,15 +74,12 @@ def follow_index(request):
         }
     )
 
+@cache_page_by_generation(lambda slug: [group_scope(slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
 
-    post_list = Post.objects.filter(group=group).order_by("-pub_date")
-    posts_count = post_list.count()
-
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_listing().filter(group=group)
+    paginator, page = paginate(request, post_list)
 
     return render(
         request,
@@ -56,16 +87,83 @@ def group_posts(request, slug):
         {
             "group": group,
             'page':page, 
-            'paginator': paginator
+            'paginator': paginator,
+            'trending': trending_posts.ranked(group, limit=GROUP_TRENDING_SIZE),
+        }
+    )
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_updated)
+def index_feed(request, format):
+    return feed_response(
+        request, format, Post.objects.all(),
+        title='Yatube',
+        link=reverse('index'),
+        description='Последние записи',
+        updated=feed_updated(request, format),
+    )
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_updated)
+def group_feed(request, slug, format):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(
+        request, format, Post.objects.filter(group=group),
+        title=group.title,
+        link=reverse('group', args=[slug]),
+        description=group.description,
+        updated=feed_updated(request, format, slug=slug),
+    )
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_updated)
+def profile_feed(request, username, format):
+    author = get_author_or_404(username)
+    return feed_response(
+        request, format, author.posts.all(),
+        title=author.get_full_name() or author.username,
+        link=reverse('profile', args=[username]),
+        description=f'Записи {author.username}',
+        updated=feed_updated(request, format, username=username),
+    )
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    group_slug = request.GET.get('group', '')
+    username = request.GET.get('author', '')
+    group = get_object_or_404(Group, slug=group_slug) if group_slug else None
+    author = get_author_or_404(username) if username else None
+
+    paginator = search_paginator(query, POSTS_PER_PAGE, group=group, author=author)
+    page = paginator.get_page(request.GET.get('cursor'))
+    filters = {
+        key: value
+        for key, value in (('q', query), ('group', group_slug), ('author', username))
+        if value
+    }
+
+    return render(
+        request,
+        'search.html',
+        {
+            'query': query,
+            'group': group,
+            'author': author,
+            'page': page,
+            'paginator': paginator,
+            'querystring': urlencode(filters) + '&' if filters else '',
         }
     )
 
 
+@use_primary
 @login_required
+@transaction.atomic
 def new_post(request):
     post_is_new = True
     if request.method == "POST":
-        form = PostForm(request.POST)
+        form = PostForm(request.POST, files=request.FILES or None)
 
         if form.is_valid():
             new = form.save(commit=False)
@@ -78,14 +176,13 @@ def new_post(request):
     return render(request, 'post_edit.html', {'form': form, 'post_is_new': post_is_new})
 
 
+@cache_page_by_generation(lambda username: [author_scope(username)])
 def profile(request, username):
     profile = True
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    posts_count = post_list.count
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    author = get_author_or_404(username)
+    post_list = author.posts.for_listing()
+    stats = stats_for(author.pk)
+    paginator, page = paginate(request, post_list)
     
 
     following = (
@@ -101,7 +198,8 @@ def profile(request, username):
         request, 
         'profile.html', 
         {   
-            'posts_count': posts_count,
+            'posts_count': stats.posts_count,
+            'stats': stats,
             'page': page, 
             'author': author,
             'paginator': paginator,
@@ -110,15 +208,18 @@ def profile(request, username):
     )
  
  
+@cache_page_by_generation(
+    lambda username, post_id: [author_scope(username), post_scope(post_id)]
+)
 def post_view(request, username, post_id):
     profile = False
-    post = get_object_or_404(
-        Post,
-        author__username=username,
-        pk=post_id
-    )
-    author = get_object_or_404(User, username=username)
-    posts_count = author.posts.all().count
+    post = get_post_or_404(username, post_id)
+    stats = post.author.stats
+    comments = post.comments.select_related('author').order_by('path')
+    # The comment being answered, as a queryset of at most one row.
+    reply_to = post.comments.none()
+    if comment_id(request.GET.get('reply')):
+        reply_to = comments.filter(pk=comment_id(request.GET['reply']))[:1]
     form = CommentForm()
     
     return render(
@@ -126,18 +227,56 @@ def post_view(request, username, post_id):
         'post_view.html',
         {   
             'profile': profile,
-            'posts_count': posts_count,
+            'posts_count': stats.posts_count,
+            'stats': stats,
             'post': post, 
             'author': post.author, 
+            'comments_page': paginate_comments(request, comments),
+            'reply_to': reply_to,
             'form': form,
         }
     )
 
 
+@cache_page_by_generation(lambda username, post_id: [post_scope(post_id)])
+def post_comments(request, username, post_id):
+    """
+    HTML fragment with one page of a post's comments, or with one thread
+    when `?thread=<comment id>` is given, for the "show more" link.
+    """
+    post = get_object_or_404(
+        Post.objects.only('pk', 'author__username').select_related('author'),
+        author_id=get_author_or_404(username).pk,
+        pk=post_id,
+    )
+    comments = post.comments.select_related('author')
+    thread = comment_id(request.GET.get('thread'))
+    if thread is not None:
+        root = get_object_or_404(post.comments.only('pk', 'post', 'path'), pk=thread)
+        comments = Comment.objects.thread(root).select_related('author')
+
+    return render(
+        request,
+        'comments_page.html',
+        {
+            'post': post,
+            'page': paginate_comments(request, comments),
+            'thread': thread,
+        }
+    )
+
+
+@use_primary
 @login_required
+@transaction.atomic
 def post_edit(request, username, post_id):
     post_is_new = False
-    post = get_object_or_404(Post, author__username=username, id=post_id)
+    if request.method == 'POST':
+        post = get_object_or_404(
+            Post, author_id=get_author_or_404(username).pk, id=post_id
+        )
+    else:
+        post = get_post_or_404(username, post_id)
 
     if request.user != post.author:
         return redirect("post", username=username, post_id=post_id)
@@ -150,18 +289,26 @@ def post_edit(request, username, post_id):
     return render(request, 'post_edit.html', {'post':post, 'form': form, 'post_is_new': post_is_new})
     
 
+@use_primary
 @login_required
+@transaction.atomic
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, pk=post_id)
-    comments = Comment.objects.filter(post=post_id)
+    post = get_object_or_404(Post, author_id=get_author_or_404(username).pk, pk=post_id)
+    parent = None
+    if comment_id(request.POST.get('parent')):
+        parent = post.comments.filter(pk=comment_id(request.POST['parent'])).first()
+    if parent is not None and parent.depth + 1 >= COMMENT_MAX_DEPTH:
+        # Too deep to indent further: answer next to the parent instead.
+        parent = parent.parent
         
     form = CommentForm(request.POST or None)
     if form.is_valid():
         form = form.save(commit=False)
         form.author = request.user
         form.post = post
+        form.parent = parent
         form.save()
-        return redirect('post', username=post.author.username, post_id=post_id)
+        return redirect('post', username=username, post_id=post_id)
     form = CommentForm()
     return redirect("post", username=username, post_id=post_id)
 
@@ -179,24 +326,65 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+@use_primary
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    samefollow = Follow.objects.filter(user=request.user, author=author)
-    
-    if request.user != author and not samefollow.exists():
-        Follow.objects.create(
-            user = request.user,
-            author = author
-        )
+    author = get_author_or_404(username)
+    if request.user != author:
+        # The unique pair makes a concurrent follow fail on INSERT;
+        # get_or_create then returns the row that won.
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username=username)
-    
 
 
+@use_primary
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follows = Follow.objects.filter(user = request.user, author = author)
-    if follows.exists():
-        follows.delete()
-    return redirect('profile', username=username)
\ No newline at end of file
+    author = get_author_or_404(username)
+    Follow.objects.filter(user=request.user, author=author).delete()
+    return redirect('profile', username=username)
+
+
+def follow_list(request, username, title, follows, related):
+    """
+    A page of `follows` shown as the users on their `related` side, seeking
+    on that user's id through one of the Follow pair indexes.
+    """
+    author = get_author_or_404(username)
+    paginator = CursorPaginator(
+        follows(author).select_related(related), FOLLOWS_PER_PAGE,
+        ordering=('-%s_id' % related,),
+    )
+    page = paginator.get_page(request.GET.get('cursor'))
+    stats = stats_for(author.pk)
+    return render(
+        request,
+        'follow_list.html',
+        {
+            'title': title,
+            'author': author,
+            'stats': stats,
+            'posts_count': stats.posts_count,
+            'page': page,
+            'users': [getattr(follow, related) for follow in page],
+            'paginator': paginator,
+        }
+    )
+
+
+@cache_page_by_generation(lambda username: [author_scope(username)])
+def profile_followers(request, username):
+    return follow_list(
+        request, username, 'Подписчики',
+        lambda author: Follow.objects.filter(author=author), 'user',
+    )
+
+
+@cache_page_by_generation(lambda username: [author_scope(username)])
+def profile_following(request, username):
+    return follow_list(
+        request, username, 'Подписки',
+        lambda author: Follow.objects.filter(user=author), 'author',
+    )
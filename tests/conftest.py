@@ -1,4 +1,22 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
+    'tests.fixtures.fixture_queries',
 ]
+
+
+@pytest.fixture(autouse=True)
+def render_thumbnails_inline(settings):
+    # A worker thread would still be writing while the test database is
+    # flushed after a transactional test.
+    settings.THUMBNAIL_WORKERS = 0
+
+
+@pytest.fixture(autouse=True)
+def cache_in_memory(settings):
+    # Keep the suite off the cache file the running site uses.
+    settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
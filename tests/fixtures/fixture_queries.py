@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+
+import pytest
+
+# Every budgeted view is measured with this many posts on its page, so a
+# query per post shows up as a budget failure on the larger pages.
+PAGE_SIZES = [10, 100, 1000]
+
+
+@pytest.fixture(params=PAGE_SIZES, ids=lambda size: f'{size}_per_page')
+def page_size(request, monkeypatch):
+    from posts import syndication, views
+    monkeypatch.setattr(views, 'POSTS_PER_PAGE', request.param)
+    monkeypatch.setattr(syndication, 'FEED_ITEMS', request.param)
+    return request.param
+
+
+@pytest.fixture
+def author(django_user_model):
+    return django_user_model.objects.create_user(username='TestAuthor', password='1234567')
+
+
+@pytest.fixture
+def author_client(author):
+    # Not the `client` fixture: `user_client` is already logged in on it.
+    from django.test import Client
+    client = Client()
+    client.force_login(author)
+    return client
+
+
+@pytest.fixture
+def page_of_posts(page_size, user, author, group):
+    """
+    `page_size` posts by `author` in `group`, followed by `user`, with one
+    comment by `user` on each and `page_size` comments on the newest post.
+    Rows are bulk inserted, so the derived data is rebuilt as after an import.
+    """
+    from posts import counters, feed, search
+    from posts.models import Comment, Follow, Post
+
+    Follow.objects.create(user=user, author=author)
+    Post.objects.bulk_create(
+        Post(text=f'Пост {number} про котиков', author=author, group=group)
+        for number in range(page_size)
+    )
+    posts = list(Post.objects.filter(author=author).order_by('-pub_date', '-id'))
+    comments = [Comment(post=post, author=user, text='Комментарий') for post in posts]
+    comments += [
+        Comment(post=posts[0], author=user, text='Комментарий')
+        for _ in range(page_size - 1)
+    ]
+    Comment.objects.bulk_create(comments)
+    for _ in counters.repair():
+        pass
+    search.rebuild_index()
+    feed.backfill(user.pk, author.pk)
+    return posts
+
+
+@pytest.fixture
+def query_budget():
+    """
+    `with query_budget(n): ...` fails the test if the block runs more than
+    `n` queries. The cache is emptied first, so pages render from scratch.
+    """
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    @contextmanager
+    def budget(limit):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > limit:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(context.captured_queries, 1)
+            )
+            pytest.fail(
+                f'{len(context)} queries over a budget of {limit}:\n{queries}',
+                pytrace=False,
+            )
+    return budget
@@ -0,0 +1,99 @@
+import pytest
+from django.db import connection
+
+
+def in_bulk_queries(page_size):
+    # in_bulk() splits the keys into as many batches as the database needs.
+    batch_size = connection.features.max_query_params or page_size
+    return -(-page_size // batch_size)
+
+
+# (url, query budget) for pages listing `page_size` posts or comments,
+# requested by a logged in follower of the author. A callable budget is
+# given the page size.
+PAGES = [
+    pytest.param('/', 3, id='index'),
+    pytest.param('/group/test-link/', 5, id='group'),
+    pytest.param('/follow/', lambda size: 4 + in_bulk_queries(size), id='follow_index'),
+    pytest.param(
+        '/search/?q=котиков', lambda size: 3 + in_bulk_queries(size), id='search'
+    ),
+    pytest.param('/trending/', 3, id='trending'),
+    pytest.param('/TestAuthor/', 6, id='profile'),
+    # The cache starts empty: one query resolves the username into it.
+    pytest.param('/TestAuthor/{post.id}/', 5, id='post'),
+    pytest.param('/TestAuthor/{post.id}/comments/', 5, id='post_comments'),
+    pytest.param('/feed/atom/', 2, id='index_feed'),
+    pytest.param('/group/test-link/feed/rss/', 3, id='group_feed'),
+    pytest.param('/TestAuthor/feed/json/', 3, id='profile_feed'),
+    pytest.param('/TestAuthor/followers/', 5, id='profile_followers'),
+    pytest.param('/TestUser/following/', 5, id='profile_following'),
+]
+
+# (client fixture, method, url, data, query budget) for forms and actions.
+ACTIONS = [
+    pytest.param('client', 'get', '/auth/signup/', None, 2, id='signup'),
+    pytest.param('user_client', 'get', '/new/', None, 5, id='new_post'),
+    pytest.param('user_client', 'post', '/new/', {'text': 'Новый пост'}, 11, id='new_post_submit'),
+    pytest.param(
+        'author_client', 'get', '/TestAuthor/{post.id}/edit/', None, 7, id='post_edit'
+    ),
+    pytest.param(
+        'author_client', 'post', '/TestAuthor/{post.id}/edit/', {'text': 'Правка'}, 12,
+        id='post_edit_submit',
+    ),
+    # One more than the INSERT: the path holds the new comment's own id.
+    # Three for the trending bucket when it is the first event of the hour.
+    pytest.param(
+        'user_client', 'post', '/TestAuthor/{post.id}/comment', {'text': 'Ещё'}, 14,
+        id='add_comment',
+    ),
+    pytest.param('user_client', 'get', '/TestAuthor/unfollow/', None, 12, id='profile_unfollow'),
+]
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('url, budget', PAGES)
+    def test_page_within_budget(
+        self, user_client, page_of_posts, page_size, query_budget, url, budget
+    ):
+        url = url.format(post=page_of_posts[0])
+        if callable(budget):
+            budget = budget(page_size)
+        with query_budget(budget):
+            response = user_client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        assert response.status_code == 200, f'Страница `{url}` не открывается'
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('client_name, method, url, data, budget', ACTIONS)
+    def test_action_within_budget(
+        self, request, page_of_posts, query_budget, client_name, method, url, data, budget
+    ):
+        client = request.getfixturevalue(client_name)
+        url = url.format(post=page_of_posts[0])
+        with query_budget(budget):
+            response = getattr(client, method)(url, data)
+        assert response.status_code in (200, 302), f'Адрес `{url}` работает неправильно'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_follow_within_budget(
+        self, user_client, author, query_budget, page_of_posts, page_size
+    ):
+        from django.db import connection
+        from posts.models import Follow
+        Follow.objects.filter(author=author).delete()
+        # Following backfills the feed with the author's posts: one INSERT
+        # per batch the database accepts, never one per post.
+        fields = ['user', 'post', 'author', 'pub_date']
+        batch_size = connection.ops.bulk_batch_size(fields, page_of_posts)
+        batches = -(-page_size // batch_size)
+        # get_or_create wraps its INSERT in a savepoint to survive a race;
+        # four more find the author's newest post and start its trending bucket.
+        with query_budget(17 + batches):
+            response = user_client.get('/TestAuthor/follow/')
+        assert response.status_code == 302
+        assert Follow.objects.filter(author=author).exists()
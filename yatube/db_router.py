@@ -0,0 +1,118 @@
+"""
+Read replicas with read-your-writes.
+
+`ReplicaRouter` sends the reads of a safe request to one alias of
+DATABASE_REPLICAS, picked for the whole request, and every write to
+`default`. A request that writes content answers with a cookie that keeps
+the client on `default` for REPLICA_PIN_SECONDS, so an author sees their
+own post while the replicas catch up:
+
+    DATABASES = {'default': {...}, 'replica1': {...}}
+    DATABASE_REPLICAS = ['replica1']
+    DATABASE_ROUTERS = ['yatube.db_router.ReplicaRouter']
+    MIDDLEWARE = [..., 'yatube.db_router.ReplicaPinMiddleware', ...]
+
+The pin is a cookie rather than a session key because the session itself
+is read through the router. Views that write on GET, or read what they
+are about to change, are wrapped in `use_primary`; their writes pin the
+client, and so does `pin()`, which the signal handlers of content writes
+call. Bookkeeping writes elsewhere, such as saving the session, do not.
+Reads outside a request (commands, signal handlers in worker threads)
+always go to `default`.
+
+Replication lag is not measured: a page rendered from a replica that is
+behind stays in the generation cache until its scope is written again.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'primary_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_local = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return getattr(_local, 'replica', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if getattr(_local, 'primary', False):
+            pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+def pin():
+    """Keep the client of the current request on `default` for a while."""
+    _local.wrote = True
+
+
+def pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not replicas():
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS and not pinned(request):
+            _local.replica = random.choice(replicas())
+        else:
+            _local.replica = None
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _local.wrote
+        finally:
+            _local.replica = None
+            _local.wrote = False
+
+        if wrote:
+            window = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + window)),
+                max_age=window, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def use_primary(view):
+    """Run `view` against `default` only, reads included; its writes pin."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replica = getattr(_local, 'replica', None)
+        primary = getattr(_local, 'primary', False)
+        _local.replica = None
+        _local.primary = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _local.replica = replica
+            _local.primary = primary
+    return wrapper
@@ -0,0 +1,141 @@
+"""
+Per-request metrics that are cheap enough to leave on in production.
+
+For a sample of requests `RequestMetricsMiddleware` counts the SQL queries
+and their time, the template render time and the cache hits and misses,
+then reports them in a `Server-Timing` header and one log line on the
+`yatube.requests` logger:
+
+    MIDDLEWARE = ['yatube.instrumentation.RequestMetricsMiddleware', ...]
+    REQUEST_METRICS_SAMPLE_RATE = 0.05
+
+With a sample rate of 0 the middleware removes itself at startup. Render
+time needs the `InstrumentedDjangoTemplates` backend in TEMPLATES; cache
+hits and misses are reported by `yatube.sqlite_cache.SQLiteCache`.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger('yatube.requests')
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.rendering = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper() for every query.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+    def as_dict(self):
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'db_queries': self.queries,
+            'db_ms': round(self.sql_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def current():
+    """Metrics of the request being handled by this thread, if sampled."""
+    return getattr(_local, 'metrics', None)
+
+
+def record_cache(hits, misses):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def server_timing(data):
+    return ', '.join([
+        'db;dur=%s;desc="%d queries"' % (data['db_ms'], data['db_queries']),
+        'tpl;dur=%s' % data['render_ms'],
+        'cache;desc="%d hits, %d misses"' % (data['cache_hits'], data['cache_misses']),
+        'total;dur=%s' % data['total_ms'],
+    ])
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        metrics = _local.metrics = RequestMetrics()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+
+        data = metrics.as_dict()
+        response['Server-Timing'] = server_timing(data)
+        logger.info(
+            'method=%s path=%s status=%s %s',
+            request.method, request.path, response.status_code,
+            ' '.join('%s=%s' % item for item in data.items()),
+            extra={'request_metrics': data},
+        )
+        return response
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current()
+        # Only the outermost render is timed, so included templates rendered
+        # through the backend are not counted twice.
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.render_time += time.perf_counter() - started
+            metrics.rendering -= 1
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for RequestMetrics."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
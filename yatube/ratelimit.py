@@ -0,0 +1,136 @@
+"""
+Token-bucket rate limiting for the views that write, kept in the cache.
+
+Rules are keyed by URL name, for any URL name in the project:
+
+    MIDDLEWARE = [..., 'django.contrib.auth.middleware.AuthenticationMiddleware',
+                  'yatube.ratelimit.RateLimitMiddleware', ...]
+    RATE_LIMITS = {
+        'add_comment': '30/m',
+        'signup': {'rate': '5/m', 'methods': ['POST']},
+    }
+
+A rate of '30/m' lets a client make 30 requests at once, then one more
+every two seconds. Logged in users are limited per user, everyone else
+per IP address (REMOTE_ADDR, so a proxy in front must set it). A request
+over the limit gets a 429 with a Retry-After header. Views outside
+RATE_LIMITS can be wrapped in `ratelimit('10/m')` instead.
+
+Each bucket is a single cache key holding the time its next token is due
+(GCRA), moved forward with the atomic `incr`: an allowed request costs
+one cache write and no database query. With an empty RATE_LIMITS the
+middleware removes itself at startup.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.shortcuts import render
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# A bucket that keeps being used never gets reset by `set`, so its key is
+# allowed to expire, granting one extra burst, at most once a day.
+KEY_TIMEOUT = 24 * 60 * 60
+
+
+class Rule:
+    def __init__(self, rate, methods=None):
+        try:
+            count, unit = rate.split('/')
+            self.burst = int(count)
+            self.period = PERIODS[unit]
+        except (KeyError, ValueError):
+            raise ImproperlyConfigured('Bad rate %r, expected like "30/m"' % rate)
+        # Milliseconds between two tokens.
+        self.interval = self.period * 1000 // self.burst
+        self.methods = {method.upper() for method in methods} if methods else None
+
+    @classmethod
+    def from_setting(cls, spec):
+        if isinstance(spec, str):
+            return cls(spec)
+        return cls(spec['rate'], spec.get('methods'))
+
+    def applies(self, request):
+        return self.methods is None or request.method in self.methods
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user:%s' % user.pk
+    return 'ip:%s' % request.META.get('REMOTE_ADDR', '')
+
+
+def take(key, rule, now=None):
+    """
+    Take a token from the bucket at `key`. Returns 0 when allowed, or the
+    seconds until a token is available.
+    """
+    now = int((time.time() if now is None else now) * 1000)
+    timeout = max(KEY_TIMEOUT, 2 * rule.period)
+    try:
+        due = cache.incr(key, rule.interval)
+    except ValueError:
+        if cache.add(key, now + rule.interval, timeout):
+            return 0
+        due = cache.incr(key, rule.interval)
+    if due - rule.interval < now:
+        # Unused long enough to be full again: start over from now.
+        cache.set(key, now + rule.interval, timeout)
+        return 0
+    excess = due - now - rule.burst * rule.interval
+    if excess <= 0:
+        return 0
+    # Refused requests do not use up tokens.
+    cache.decr(key, rule.interval)
+    return max(1, math.ceil(excess / 1000))
+
+
+def check(request, name, rule):
+    """None if the request may go on, else the 429 response to send."""
+    if not rule.applies(request):
+        return None
+    wait = take('ratelimit:%s:%s' % (name, client_key(request)), rule)
+    if not wait:
+        return None
+    response = render(request, 'misc/429.html', {'retry_after': wait}, status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def ratelimit(rate, methods=None, name=None):
+    """Limit a single view; `name` shares a bucket between views."""
+    rule = Rule(rate, methods)
+
+    def decorator(view):
+        bucket = name or '%s.%s' % (view.__module__, view.__qualname__)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return check(request, bucket, rule) or view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        limits = getattr(settings, 'RATE_LIMITS', {})
+        if not limits:
+            raise MiddlewareNotUsed
+        self.rules = {name: Rule.from_setting(spec) for name, spec in limits.items()}
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = request.resolver_match.url_name
+        rule = self.rules.get(name)
+        if rule is None:
+            return None
+        return check(request, name, rule)
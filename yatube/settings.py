@@ -48,30 +48,49 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    "debug_toolbar",
 ]
 
 MIDDLEWARE = [
+    'yatube.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'yatube.db_router.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# debug_toolbar только для разработки: в продакшене метрики запросов
+# собирает RequestMetricsMiddleware
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Ограничение частоты запросов, которые пишут в базу: имя URL -> сколько
+# запросов подряд и за какой период ('s', 'm', 'h', 'd') восстанавливается
+# весь запас. Вошедших считаем по пользователю, остальных по IP-адресу
+RATE_LIMITS = {
+    'new_post': {'rate': '10/m', 'methods': ['POST']},
+    'post_edit': {'rate': '30/m', 'methods': ['POST']},
+    'add_comment': {'rate': '30/m', 'methods': ['POST']},
+    'profile_follow': '60/m',
+    'profile_unfollow': '60/m',
+    'signup': {'rate': '5/m', 'methods': ['POST']},
+}
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "yatube.instrumentation.InstrumentedDjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -98,6 +117,35 @@ DATABASES = {
     }
 }
 
+# Профиль SQLite для продакшена включается переменной окружения
+# YATUBE_SQLITE_PRODUCTION=1. PRAGMAS выполняются на каждом новом соединении:
+# WAL не даёт писателю блокировать читателей, mmap и кеш страниц ускоряют
+# чтение, busy_timeout заставляет ждать блокировку вместо ошибки. Транзакции
+# сразу берут блокировку на запись (BEGIN IMMEDIATE), иначе писатели падают
+# с database is locked. Соединения живут CONN_MAX_AGE секунд, статистику
+# планировщика обновляет cron: manage.py optimize_database
+if os.environ.get('YATUBE_SQLITE_PRODUCTION'):
+    DATABASES['default'].update({
+        'ENGINE': 'yatube.sqlite_backend',
+        'CONN_MAX_AGE': 600,
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'TRANSACTION_MODE': 'IMMEDIATE',
+    })
+
+# Алиасы реплик из DATABASES: на них уходят чтения безопасных запросов.
+# После записи клиент читает только из default ещё REPLICA_PIN_SECONDS
+# секунд, чтобы сразу видеть свои посты; пустой список — реплик нет
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['yatube.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -169,8 +217,68 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Один файл SQLite в режиме WAL на всех воркеров сервера
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
-}
\ No newline at end of file
+}
+
+# Лента подписок: посты авторов, у которых подписчиков больше порога,
+# не раскладываются по лентам, а подмешиваются при чтении
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_LIMIT = 1000
+
+# Популярное: комментарии и подписки копятся в почасовых счётчиках, вес
+# которых вдвое падает каждые TRENDING_HALF_LIFE_HOURS часов; команда
+# compact_trending (запускать раз в несколько минут) пересобирает топ сайта
+# и каждой группы из TRENDING_SIZE записей
+TRENDING_WINDOW_HOURS = 48
+TRENDING_HALF_LIFE_HOURS = 6
+TRENDING_SIZE = 50
+
+# Страницы кешируются надолго: ключ содержит поколения, которые сбрасываются
+# сигналами при каждой записи
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Размеры превью картинок постов, которые используют шаблоны; превью
+# готовятся пулом потоков после сохранения поста (при THUMBNAIL_WORKERS = 0 —
+# сразу после коммита, без потоков)
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_WORKERS = 2
+
+# Доля запросов, для которых считаются SQL-запросы, время рендеринга и
+# попадания в кеш (заголовок Server-Timing и лог yatube.requests); 0 — выключено
+REQUEST_METRICS_SAMPLE_RATE = 0.05
+
+# Строки метрик запросов (yatube.requests) пишутся в stderr, откуда их
+# забирает менеджер процессов сервера
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'metrics': {
+            'format': '{asctime} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'metrics',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,37 @@
+"""
+The stock SQLite backend, plus PRAGMAs run on every new connection and a
+choice of transaction mode.
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'yatube.sqlite_backend',
+            'NAME': 'db.sqlite3',
+            'CONN_MAX_AGE': 600,
+            'PRAGMAS': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+            'TRANSACTION_MODE': 'IMMEDIATE',
+        }
+    }
+
+PRAGMAS are applied in order. journal_mode=WAL lets readers run alongside
+the single writer; it is stored in the file, the others last for the
+connection, which is why persistent connections (CONN_MAX_AGE) pay for
+them once. `manage.py optimize_database` refreshes the planner statistics.
+
+With TRANSACTION_MODE = 'IMMEDIATE', atomic() takes the write lock at
+BEGIN. A deferred transaction that reads and then writes fails at once
+with "database is locked" when another writer got in between, without
+waiting for busy_timeout.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            connection.execute('PRAGMA %s = %s' % (name, value))
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE')
+        self.cursor().execute('BEGIN %s' % mode if mode else 'BEGIN')
@@ -0,0 +1,331 @@
+"""
+Cache backend shared by every worker process on the host.
+
+Entries live in one SQLite file in WAL mode, so readers never block each
+other or the writer and an invalidation made by one gunicorn worker is seen
+by all of them. The file is bounded by MAX_SIZE bytes and evicts the least
+recently used entries first.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_SIZE': 256 * 1024 * 1024},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .instrumentation import record_cache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL,'
+    ' size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    "INSERT OR IGNORE INTO stats VALUES ('size', 0), ('hits', 0), "
+    "('misses', 0), ('evictions', 0)",
+)
+
+NOT_EXPIRED = '(expires IS NULL OR expires > ?)'
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        # Fraction of MAX_SIZE to free at once, so eviction is not run per set.
+        self._cull_ratio = float(options.get('CULL_RATIO', 0.1))
+        # Only rewrite an entry's LRU stamp when it is older than this, so a
+        # hot key does not turn every read into a write.
+        self._touch_interval = float(options.get('TOUCH_INTERVAL', 10))
+        self._busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self._local = threading.local()
+        self._counts_lock = threading.Lock()
+        self._counts = {'hits': 0, 'misses': 0}
+        self._flushed = time.time()
+
+    # Connections
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # First use in this thread, or we were forked by the server.
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout / 1000,
+                isolation_level=None, check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA busy_timeout=%d' % self._busy_timeout)
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _write(self, operation):
+        """Run `operation(connection)` inside one IMMEDIATE transaction."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = operation(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    # Serialization: plain ints are stored as SQLite integers, the rest pickled.
+
+    def _dumps(self, value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _loads(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _sizeof(stored):
+        return 8 if isinstance(stored, int) else len(stored)
+
+    # Statistics
+
+    def _count(self, hits, misses):
+        record_cache(hits, misses)
+        with self._counts_lock:
+            self._counts['hits'] += hits
+            self._counts['misses'] += misses
+            if time.time() - self._flushed < 1:
+                return
+            counts, self._counts = self._counts, {'hits': 0, 'misses': 0}
+            self._flushed = time.time()
+        self._write(lambda connection: connection.executemany(
+            'UPDATE stats SET value = value + ? WHERE name = ?',
+            [(counts['hits'], 'hits'), (counts['misses'], 'misses')],
+        ))
+
+    def stats(self):
+        """Hit/miss counters, stored bytes and entry count across all workers."""
+        with self._counts_lock:
+            pending = dict(self._counts)
+        connection = self._connection()
+        stats = dict(connection.execute('SELECT name, value FROM stats'))
+        stats['hits'] += pending['hits']
+        stats['misses'] += pending['misses']
+        stats['entries'] = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        stats['max_size'] = self._max_size
+        return stats
+
+    # Reads
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = {}
+        for key in keys:
+            stored_key = self.make_key(key, version)
+            self.validate_key(stored_key)
+            key_map[stored_key] = key
+        if not key_map:
+            return {}
+
+        now = time.time()
+        rows = self._connection().execute(
+            'SELECT key, value, accessed FROM cache WHERE key IN (%s) AND %s' % (
+                ', '.join('?' * len(key_map)), NOT_EXPIRED,
+            ),
+            [*key_map, now],
+        ).fetchall()
+
+        result = {}
+        stale = []
+        for stored_key, value, accessed in rows:
+            result[key_map[stored_key]] = self._loads(value)
+            if now - accessed > self._touch_interval:
+                stale.append((now, stored_key))
+        if stale:
+            self._write(lambda connection: connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', stale
+            ))
+        self._count(len(result), len(key_map) - len(result))
+        return result
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND %s' % NOT_EXPIRED,
+            [key, time.time()],
+        ).fetchone()
+        return row is not None
+
+    # Writes
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        stored = self._dumps(value)
+        expires = self.get_backend_timeout(timeout)
+
+        def add(connection):
+            now = time.time()
+            row = connection.execute(
+                'SELECT expires FROM cache WHERE key = ?', [key]
+            ).fetchone()
+            if row is not None and (row[0] is None or row[0] > now):
+                return False
+            self._store(connection, [(key, stored, expires)], now)
+            return True
+        return self._write(add)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        entries = []
+        for key, value in data.items():
+            key = self.make_key(key, version)
+            self.validate_key(key)
+            entries.append((key, self._dumps(value), expires))
+        if entries:
+            self._write(lambda connection: self._store(connection, entries, time.time()))
+        return []
+
+    def _store(self, connection, entries, now):
+        keys = [key for key, _, _ in entries]
+        old = connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM cache WHERE key IN (%s)'
+            % ', '.join('?' * len(keys)), keys,
+        ).fetchone()[0]
+        rows = [
+            (key, stored, expires, now, self._sizeof(stored))
+            for key, stored, expires in entries
+        ]
+        connection.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed, size) '
+            'VALUES (?, ?, ?, ?, ?)', rows,
+        )
+        added = sum(row[4] for row in rows) - old
+        connection.execute(
+            "UPDATE stats SET value = value + ? WHERE name = 'size'", [added]
+        )
+        size = connection.execute(
+            "SELECT value FROM stats WHERE name = 'size'"
+        ).fetchone()[0]
+        if size > self._max_size:
+            self._cull(connection, now)
+
+    def _cull(self, connection, now):
+        """Drop expired entries, then least recently used ones, to free space."""
+        target = self._max_size * (1 - self._cull_ratio)
+        connection.execute('DELETE FROM cache WHERE expires <= ?', [now])
+        evicted = 0
+        size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if size > target:
+            cursor = connection.execute('SELECT key, size FROM cache ORDER BY accessed')
+            victims = []
+            for key, entry_size in cursor:
+                victims.append((key,))
+                size -= entry_size
+                if size <= target:
+                    break
+            cursor.close()
+            connection.executemany('DELETE FROM cache WHERE key = ?', victims)
+            evicted = len(victims)
+        connection.execute("UPDATE stats SET value = ? WHERE name = 'size'", [size])
+        connection.execute(
+            "UPDATE stats SET value = value + ? WHERE name = 'evictions'", [evicted]
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        expires = self.get_backend_timeout(timeout)
+
+        def touch(connection):
+            now = time.time()
+            cursor = connection.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND %s'
+                % NOT_EXPIRED, [expires, now, key, now],
+            )
+            return cursor.rowcount > 0
+        return self._write(touch)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+
+        def incr(connection):
+            now = time.time()
+            row = connection.execute(
+                'SELECT value, size FROM cache WHERE key = ? AND %s' % NOT_EXPIRED,
+                [key, now],
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._loads(row[0]) + delta
+            stored = self._dumps(value)
+            size = self._sizeof(stored)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? WHERE key = ?',
+                [stored, size, now, key],
+            )
+            connection.execute(
+                "UPDATE stats SET value = value + ? WHERE name = 'size'",
+                [size - row[1]],
+            )
+            return value
+        return self._write(incr)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        if not keys:
+            return
+
+        def delete(connection):
+            placeholders = ', '.join('?' * len(keys))
+            freed = connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM cache WHERE key IN (%s)'
+                % placeholders, keys,
+            ).fetchone()[0]
+            connection.execute('DELETE FROM cache WHERE key IN (%s)' % placeholders, keys)
+            connection.execute(
+                "UPDATE stats SET value = value - ? WHERE name = 'size'", [freed]
+            )
+        self._write(delete)
+
+    def clear(self):
+        def clear(connection):
+            connection.execute('DELETE FROM cache')
+            connection.execute("UPDATE stats SET value = 0 WHERE name = 'size'")
+        self._write(clear)
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests on purpose.
+        pass
@@ -32,6 +32,7 @@ urlpatterns = [
     path('contacts/', views.flatpage, {'url': '/contacts/'}, name='contacts'),
     path('about-author/', views.flatpage, {'url': '/about-author/'}, name='about-author'),
     path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='about-spec'),
+    path("api/v1/", include("posts.api_urls")),
     path("", include("posts.urls")),
 ]
 if settings.DEBUG: